@@ -1,9 +1,25 @@
 """Abstract Base class for Tokenizers."""
 
+import heapq
 import os
 import unicodedata
 from abc import ABC, abstractmethod
-from typing import Literal
+from array import array
+from collections.abc import Sequence
+from itertools import islice
+from typing import Final, Literal, TextIO
+
+# the 256 single-byte tokens every vocab starts with, built once at import
+# instead of on every _build_vocab call
+_BASE_BYTE_VOCAB: Final[tuple[bytes, ...]] = tuple(
+    bytes([byte_value]) for byte_value in range(256)
+)
+
+# every ASCII control character (category Cc) -> its \uXXXX escape, the
+# only ASCII characters _replace_control_characters has to touch
+_ASCII_CONTROL_ESCAPES: Final[dict[int, str]] = {
+    code_point: f"\\u{code_point:04x}" for code_point in (*range(0x20), 0x7F)
+}
 
 
 class BaseTokenizer(ABC):
@@ -16,17 +32,14 @@ class BaseTokenizer(ABC):
         self.source: str = ""
         self.special_tokens: dict[str, int] = {}  # e.g. {'\u0000': 100257}
         self.vocab: dict[int, bytes] = self._build_vocab()
+        # dense copy of vocab for decode, see _reset_caches
+        self._vocab_list: list[bytes] = []
+        self._reset_caches()
 
     # Private method to build the vocabulary
     def _build_vocab(self) -> dict[int, bytes]:
-        # Create an empty dictionary to store byte mappings
-        vocab: dict[int, bytes] = {}
-        # Loop through all possible byte values (0 to 255)
-        for byte_value in range(256):
-            # Convert the integer to a single-byte bytes object
-            byte_representation = bytes([byte_value])
-            # Map the integer (key) to its bytes object (value)
-            vocab[byte_value] = byte_representation
+        # Map every byte value (0 to 255) to its shared single-byte object
+        vocab: dict[int, bytes] = dict(enumerate(_BASE_BYTE_VOCAB))
         # loop through token merges to build combined tokens
         for (p0, p1), idx in self.token_merges.items():
             # Ensure inputs are bytes (if vocab might have mixed types)
@@ -38,6 +51,36 @@ class BaseTokenizer(ABC):
             vocab[idx] = special.encode(encoding='utf-8', errors='strict')
         return vocab
 
+    def _reset_caches(self) -> None:
+        """Rebuild the lookup tables derived from vocab and token_merges.
+        Must be called whenever the vocab changes (train, load, ...).
+        """
+        # ids are dense from 0, so a list indexed by id replaces the dict
+        # lookups in decode; it stops at the first gap (e.g. before sparse
+        # special token ids), which keep going through vocab
+        vocab_list: list[bytes] = []
+        for idx in range(len(self.vocab)):
+            if idx not in self.vocab:
+                break
+            vocab_list.append(self.vocab[idx])
+        self._vocab_list = vocab_list
+
+    # Private method to join the bytes of every id through the dense vocab
+    def _join_vocab_list(self, ids: list[int]) -> bytearray | None:
+        """Return the bytes of all ids joined, or None if any id falls
+        outside _vocab_list (special tokens, invalid ids) and needs the slow
+        path.
+        """
+        vocab_list: list[bytes] = self._vocab_list
+        # min() and max() scan in C, far cheaper than the per-id lookups
+        if ids and (min(ids) < 0 or max(ids) >= len(vocab_list)):
+            return None
+        # grow one buffer in place: no list of parts to build and then join
+        text_bytes: bytearray = bytearray()
+        for idx in ids:
+            text_bytes += vocab_list[idx]
+        return text_bytes
+
     @abstractmethod
     def train(
         self,
@@ -62,47 +105,303 @@ class BaseTokenizer(ABC):
         # Tokenizer can decode a list of integers into a string
         raise NotImplementedError
 
-    # Private method to get frequencies of adjacent token pairs
-    def _get_stats(self, ids: list[int]) -> dict[tuple[int, int], int]:
-        freq_two_tokens: dict[tuple[int, int], int] = (
-            {}
-        )  # Empty dictionary to store pairs and their counts
-        # Loop through the list from the first to the second-to-last item
-        for i in range(len(ids) - 1):
-            # Create a pair of current and next item
-            pair: tuple[int, int] = (ids[i], ids[i + 1])
-            # Check if the pair is already in the dictionary
-            if pair in freq_two_tokens:
-                freq_two_tokens[pair] = (
-                    freq_two_tokens[pair] + 1
-                )  # Increment the count
+    # Private method to apply the learned merges to a list of token ids
+    def _apply_merges(self, ids: Sequence[int]) -> list[int]:
+        """Repeatedly merge the adjacent pair with the lowest merge index,
+        until no adjacent pair has a merge left.
+
+        The tokens live in a doubly-linked list over their positions and
+        every mergeable pair sits in a min-heap keyed by (merge index,
+        position), so each merge costs O(log N) and only re-queues the two
+        pairs formed with its neighbours (FastBPE-style).
+        """
+        num_ids: int = len(ids)
+        if num_ids < 2:
+            return list(ids)
+        merges: dict[tuple[int, int], int] = self.token_merges
+        # merged in place below: work on a copy, 4 bytes per id instead of a
+        # pointer to a boxed int in a list
+        tokens: array[int] = array('i', ids)
+        prev_pos: array[int] = array('i', range(-1, num_ids - 1))
+        next_pos: array[int] = array('i', range(1, num_ids + 1))
+        next_pos[num_ids - 1] = -1  # -1 marks either end of the list
+        # seed the heap with every adjacent pair that has a merge
+        heap: list[tuple[int, int]] = []
+        pairs: zip[tuple[int, int]] = zip(
+            tokens, islice(tokens, 1, None), strict=False
+        )
+        for pos, pair in enumerate(pairs):
+            seed_rank: int | None = merges.get(pair)
+            if seed_rank is not None:
+                heap.append((seed_rank, pos))
+        heapq.heapify(heap)
+        while heap:
+            # lowest merge index first; equal ones from left to right
+            rank: int
+            rank, pos = heapq.heappop(heap)
+            right_pos: int = next_pos[pos]
+            # skip stale entries: the pair at pos changed or was removed
+            if (
+                right_pos < 0
+                or merges.get((tokens[pos], tokens[right_pos])) != rank
+            ):
+                continue
+            # the merge index is also the id of the new token
+            tokens[pos] = rank
+            # splice the right token out of the list
+            after_pos: int = next_pos[right_pos]
+            tokens[right_pos] = -1
+            next_pos[right_pos] = -1
+            next_pos[pos] = after_pos
+            # queue the new pairs formed with the neighbours
+            if after_pos >= 0:
+                prev_pos[after_pos] = pos
+                after_rank: int | None = merges.get((rank, tokens[after_pos]))
+                if after_rank is not None:
+                    heapq.heappush(heap, (after_rank, pos))
+            before_pos: int = prev_pos[pos]
+            if before_pos >= 0:
+                before_rank: int | None = merges.get(
+                    (tokens[before_pos], rank)
+                )
+                if before_rank is not None:
+                    heapq.heappush(heap, (before_rank, before_pos))
+        # removed positions hold -1, which is never a token id
+        return [token for token in tokens if token >= 0]
+
+    # Private method to learn merges over a weighted linked list of ids
+    def _learn_merges(
+        self,
+        ids: array[int],
+        prev_pos: array[int],
+        next_pos: array[int],
+        weights: array[int],
+        num_merges: int,
+        verbose: bool = False,
+    ) -> tuple[dict[tuple[int, int], int], dict[int, bytes]]:
+        """Learn up to num_merges merges, the most frequent pair first.
+
+        ids is a doubly-linked list over its positions (prev_pos/next_pos,
+        -1 at both ends of every run of tokens that can pair up), and the
+        token at each position counts weights[pos] times, e.g. the corpus
+        frequency of the word it belongs to. Among equally frequent pairs
+        the one occurring first in ids wins, as in a full rescan.
+
+        Returns:
+            A tuple of (merges, vocab).
+        """
+        # count every adjacent pair once and remember where each one starts
+        stats: dict[tuple[int, int], int] = {}
+        positions: dict[tuple[int, int], set[int]] = {}
+        for pos in range(len(ids)):
+            right_pos: int = next_pos[pos]
+            if right_pos < 0:
+                continue
+            pair_at: tuple[int, int] = (ids[pos], ids[right_pos])
+            if pair_at in stats:
+                stats[pair_at] += weights[pos]
+                positions[pair_at].add(pos)
             else:
-                freq_two_tokens[pair] = 1  # Start the count at 1
-        return freq_two_tokens  # Return the dictionary of counts
-
-    # Private method to merge pairs in the list of token ids
-    def _merge(
-        self, ids: list[int], pair: tuple[int, int], new_token: int
-    ) -> list[int]:
-        """In the list of integers (ids), replace all consecutive occurrences
-        of pair with the new integer token idx
-        Example: ids=[1, 2, 3, 1, 2], pair=(1, 2), idx=4 -> [4, 3, 4]
+                stats[pair_at] = weights[pos]
+                positions[pair_at] = {pos}
+        # max-heap (via negated counts) of (count, first position, pair);
+        # ties go to the pair seen first in the text, as in a full rescan
+        heap: list[tuple[int, int, tuple[int, int]]] = []
+        for pair_at, count in stats.items():
+            heap.append((-count, min(positions[pair_at]), pair_at))
+        heapq.heapify(heap)
+        # iteratively merge the most common pairs to create new tokens
+        merges: dict[tuple[int, int], int] = {}  # (int, int) -> int
+        vocab: dict[int, bytes] = dict(enumerate(_BASE_BYTE_VOCAB))
+        for i in range(num_merges):
+            # find the pair with the highest count
+            most_frequent_pair: tuple[int, int] | None
+            highest_count: int
+            most_frequent_pair, highest_count = self._pop_most_frequent_pair(
+                heap, stats, positions
+            )
+            if highest_count <= 0 or most_frequent_pair is None:
+                # no more pairs can be merged
+                if verbose:
+                    print(
+                        f"No more pairs can be merged at iteration {i}. Stopping early."
+                    )
+                break
+            pair: tuple[int, int] = most_frequent_pair
+            # mint a new token: assign it the next available id
+            idx: int = 256 + i
+            # replace all occurrences of pair in ids with idx, touching only
+            # the neighbours of every replaced position
+            self._merge_in_place(
+                ids,
+                prev_pos,
+                next_pos,
+                weights,
+                stats,
+                positions,
+                heap,
+                pair,
+                idx,
+            )
+            # save the merge
+            merges[pair] = idx
+            left_token: bytes = vocab[pair[0]]
+            right_token: bytes = vocab[pair[1]]
+            vocab[idx] = left_token + right_token
+            # prints
+            if verbose:
+                print(
+                    f"merge {i+1}/{num_merges}: {pair} -> {idx} ({vocab[idx]!r}) had {highest_count} occurrences"
+                )
+        return merges, vocab
+
+    def _pop_most_frequent_pair(
+        self,
+        heap: list[tuple[int, int, tuple[int, int]]],
+        stats: dict[tuple[int, int], int],
+        positions: dict[tuple[int, int], set[int]],
+    ) -> tuple[tuple[int, int] | None, int]:
+        """Pop the pair with the highest count off the lazy max-heap.
+
+        Heap entries are never updated in place: an entry whose count or
+        first position no longer matches stats/positions is stale, and is
+        either dropped or pushed back with its current key.
+
+        Returns:
+            A tuple of (most_frequent_pair, highest_count), or (None, -1)
+            if there are no pairs left.
         """
-        merge: list[int] = []
-        i: int = 0
-        while i < len(ids):
-            # if not at the very last position AND the pair matches, replace it
-            if i < len(ids) - 1:
-                current, next_token = ids[i], ids[i + 1]
-                # If we found the target pair, replace it
-                if (current, next_token) == pair:
-                    merge.append(new_token)
-                    i += 2  # skip both tokens
-                    continue
-            # Otherwise, just keep the current token
-            merge.append(ids[i])
-            i += 1
-        return merge
+        while heap:
+            neg_count, first_pos, pair = heap[0]
+            count: int = stats.get(pair, 0)
+            if count <= 0:
+                # pair was merged away entirely
+                heapq.heappop(heap)
+                continue
+            current_first_pos: int = min(positions[pair])
+            if -neg_count == count and first_pos == current_first_pos:
+                heapq.heappop(heap)
+                return pair, count
+            # stale entry: re-queue with its current key
+            heapq.heapreplace(heap, (-count, current_first_pos, pair))
+        return None, -1
+
+    def _merge_in_place(
+        self,
+        ids: array[int],
+        prev_pos: array[int],
+        next_pos: array[int],
+        weights: array[int],
+        stats: dict[tuple[int, int], int],
+        positions: dict[tuple[int, int], set[int]],
+        heap: list[tuple[int, int, tuple[int, int]]],
+        pair: tuple[int, int],
+        new_token: int,
+    ) -> None:
+        """Replace every occurrence of pair in the linked list of ids with
+        new_token, updating the counts of the neighbouring pairs
+        """
+        del stats[pair]
+        left, right = pair
+        # pairs whose count went up, queued once each after the walk
+        grown: set[tuple[int, int]] = set()
+        # walk occurrences left to right, like a scan of the whole list would
+        for pos in sorted(positions.pop(pair)):
+            right_pos: int = next_pos[pos]
+            # an overlapping occurrence may already have been consumed
+            # e.g. the middle of (a, a) in "aaa"
+            if ids[pos] != left or right_pos < 0 or ids[right_pos] != right:
+                continue
+            before_pos: int = prev_pos[pos]
+            after_pos: int = next_pos[right_pos]
+            # every pair touching this occurrence lies in the same run of
+            # ids, so they all carry the same weight
+            weight: int = weights[pos]
+            # the pairs on both sides of the occurrence are about to change
+            if before_pos >= 0:
+                self._remove_pair(
+                    stats,
+                    positions,
+                    pair,
+                    (ids[before_pos], left),
+                    before_pos,
+                    weight,
+                )
+            if after_pos >= 0:
+                self._remove_pair(
+                    stats,
+                    positions,
+                    pair,
+                    (right, ids[after_pos]),
+                    right_pos,
+                    weight,
+                )
+            # splice the right token out of the list
+            ids[pos] = new_token
+            ids[right_pos] = -1
+            next_pos[right_pos] = -1
+            next_pos[pos] = after_pos
+            if after_pos >= 0:
+                prev_pos[after_pos] = pos
+            # count the new pairs formed with the neighbours
+            if before_pos >= 0:
+                self._add_pair(
+                    stats,
+                    positions,
+                    grown,
+                    (ids[before_pos], new_token),
+                    before_pos,
+                    weight,
+                )
+            if after_pos >= 0:
+                self._add_pair(
+                    stats,
+                    positions,
+                    grown,
+                    (new_token, ids[after_pos]),
+                    pos,
+                    weight,
+                )
+        # the counts of these pairs went up, so the heap needs a fresh entry
+        # for each. Finding the first position is O(count), so push an
+        # optimistic -1 instead; the real first position is filled in if
+        # the entry reaches the top
+        for grown_pair in grown:
+            heapq.heappush(heap, (-stats[grown_pair], -1, grown_pair))
+
+    def _remove_pair(
+        self,
+        stats: dict[tuple[int, int], int],
+        positions: dict[tuple[int, int], set[int]],
+        merging_pair: tuple[int, int],
+        pair: tuple[int, int],
+        pos: int,
+        weight: int,
+    ) -> None:
+        # the pair being merged is already dropped from stats and positions
+        if pair == merging_pair:
+            return
+        # no heap push: the stale (higher) entry is fixed up on pop
+        stats[pair] -= weight
+        positions[pair].discard(pos)
+
+    def _add_pair(
+        self,
+        stats: dict[tuple[int, int], int],
+        positions: dict[tuple[int, int], set[int]],
+        grown: set[tuple[int, int]],
+        pair: tuple[int, int],
+        pos: int,
+        weight: int,
+    ) -> None:
+        if pair in stats:
+            stats[pair] += weight
+            positions[pair].add(pos)
+        else:
+            stats[pair] = weight
+            positions[pair] = {pos}
+        # one heap push per merge, however often the pair grows in it
+        grown.add(pair)
 
     def _replace_control_characters(self, s: str) -> str:
         """Replace control characters in a string with their Unicode escape sequences."""
@@ -110,6 +409,10 @@ class BaseTokenizer(ABC):
         # which distort the output (e.g. \n or much worse)
         # https://stackoverflow.com/questions/4324790/removing-control-characters-from-a-string-in-python/19016117#19016117
         # http://www.unicode.org/reports/tr44/#GC_Values_Table
+        if s.isascii():
+            # fast path (most tokens): a single C pass, no per-character
+            # unicodedata lookups
+            return s.translate(_ASCII_CONTROL_ESCAPES)
         chars: list[str] = []
         for ch in s:
             category: str = unicodedata.category(ch)
@@ -131,27 +434,6 @@ class BaseTokenizer(ABC):
         safe_string: str = self._replace_control_characters(decoded)
         return safe_string
 
-    def _get_most_frequent_pair(
-        self, stats: dict[tuple[int, int], int]
-    ) -> tuple[tuple[int, int] | None, int]:
-        """Find the pair with the highest count in stats.
-
-        Args:
-            stats: Dictionary mapping pairs to their occurrence counts
-
-        Returns:
-            A tuple of (most_frequent_pair, highest_count)
-            - most_frequent_pair: The pair with highest count, or None if stats is empty
-            - highest_count: The count of that pair (or -1 if stats is empty)
-        """
-        most_frequent_pair: tuple[int, int] | None = None
-        highest_count: int = -1
-        for pair, count in stats.items():
-            if count > highest_count:
-                highest_count = count
-                most_frequent_pair = pair
-        return most_frequent_pair, highest_count
-
     def save(self, save_dir: str, file_prefix: str) -> None:
         """Saves two files: file_prefix.vocab and file_prefix.model
         This is inspired (but not equivalent to!) sentencepiece's model saving:
@@ -195,24 +477,45 @@ class BaseTokenizer(ABC):
         inverted_merges: dict[int, tuple[int, int]] = {}
         for pair, new_idx in self.token_merges.items():
             inverted_merges[new_idx] = pair
+        # render every token once: merged tokens reuse the renderings of
+        # their children instead of decoding them again
+        render = self._render_token
+        rendered: dict[int, str] = {
+            token_idx: render(token_bytes)
+            for token_idx, token_bytes in self.vocab.items()
+        }
+        lines: list[str] = []
+        for token_idx, token_string in rendered.items():
+            if token_idx in inverted_merges:
+                # token has children: render as merge
+                left_idx, right_idx = inverted_merges[token_idx]
+                left_string: str = rendered[left_idx]
+                right_string: str = rendered[right_idx]
+                lines.append(
+                    f"[{left_string}][{right_string}] -> [{token_string}] {token_idx}\n"
+                )
+            else:
+                # leaf token
+                lines.append(f"[{token_string}] {token_idx}\n")
+        # hand the whole file to the buffered writer in one call
         with open(vocab_file, "w", encoding="utf-8") as f:
-            for token_idx, token_bytes in self.vocab.items():
-                token_string: str = self._render_token(
-                    token_bytes
-                )  # assumes render_token() is accessible
-                if token_idx in inverted_merges:
-                    # token has children: render as merge
-                    left_idx, right_idx = inverted_merges[token_idx]
-                    left_string: str = self._render_token(self.vocab[left_idx])
-                    right_string: str = self._render_token(
-                        self.vocab[right_idx]
-                    )
-                    f.write(
-                        f"[{left_string}][{right_string}] -> [{token_string}] {token_idx}\n"
-                    )
-                else:
-                    # leaf token
-                    f.write(f"[{token_string}] {token_idx}\n")
+            f.writelines(lines)
+
+    # Private method to read the merges at the end of a model file
+    def _read_merges(self, f: TextIO) -> dict[tuple[int, int], int]:
+        """Read the remaining "left right" lines of f as merges, the n-th
+        line minting token 256 + n.
+        """
+        # one read and one split for the whole block, with int() mapped in
+        # C, instead of readline + split + two int() calls per line
+        token_ids: list[int] = list(map(int, f.read().split()))
+        if len(token_ids) % 2 != 0:
+            raise ValueError("Expected two token IDs per merge line")
+        pairs: zip[tuple[int, int]] = zip(
+            token_ids[0::2], token_ids[1::2], strict=True
+        )
+        new_ids: range = range(256, 256 + len(token_ids) // 2)
+        return dict(zip(pairs, new_ids, strict=True))
 
     def load(self, model_path: str, model_filename: str) -> None:
         """Load the values of model file to the tokenizer"""
@@ -225,7 +528,6 @@ class BaseTokenizer(ABC):
         # read the model file
         merges: dict[tuple[int, int], int] = {}
         special_tokens: dict[str, int] = {}
-        idx: int = 256
         with open(model_full_path, encoding="utf-8") as f:
             # read the version
             version = f.readline().strip()
@@ -240,15 +542,8 @@ class BaseTokenizer(ABC):
                 special, special_idx = f.readline().strip().split()
                 special_tokens[special] = int(special_idx)
             # read the merges
-            for line in f:
-                # Each line should contain two token IDs separated by a space
-                left_token_str, right_token_str = line.strip().split()
-                # Convert both IDs to integers
-                left_token = int(left_token_str)
-                right_token = int(right_token_str)
-                # Register this merge pair with a new token ID
-                merges[(left_token, right_token)] = idx
-                idx += 1
+            merges = self._read_merges(f)
         self.token_merges = merges
         self.special_tokens = special_tokens
         self.vocab = self._build_vocab()
+        self._reset_caches()
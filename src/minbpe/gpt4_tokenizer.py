@@ -1,15 +1,21 @@
 """Small GPT-4 style wrapper on the Regex implementation."""
 
+import hashlib
+import heapq
 import os
+import tempfile
 from collections.abc import Mapping
+from contextlib import suppress
+from operator import itemgetter
 from types import MappingProxyType
-from typing import Final, Literal
+from typing import Final, Literal, TextIO
 
 import regex
 import tiktoken
 
+from minbpe.base_tokenizer import _BASE_BYTE_VOCAB
 from minbpe.const_protector import ConstProtector
-from minbpe.regex_tokenizer import RegexTokenizer
+from minbpe.regex_tokenizer import RegexTokenizer, _compile_pattern
 
 
 class GPT4Tokenizer(RegexTokenizer, metaclass=ConstProtector):
@@ -38,26 +44,120 @@ class GPT4Tokenizer(RegexTokenizer, metaclass=ConstProtector):
         # get the official tokenizer and its merges
         enc: tiktoken.Encoding = tiktoken.get_encoding("cl100k_base")
         mergeable_ranks: dict[bytes, int] = enc._mergeable_ranks
-        self.token_merges = self._recover_merges(mergeable_ranks)
-        # build the vocabulary
-        self.vocab = self._build_vocab()
-        # build byte shuffle mapping due to historical error in tiktoken
-        self.byte_shuffle = self._build_byte_shuffle(mergeable_ranks)
+        # recovering the merges walks the whole tiktoken vocab, so they are
+        # kept in the user cache and reused by every later process
+        # (set MINBPE_NO_CACHE=1 to always rebuild)
+        cache_file: str | None = self._cache_file(mergeable_ranks)
+        cached: tuple[dict[tuple[int, int], int], dict[int, int]] | None = (
+            self._read_cache(cache_file, len(mergeable_ranks) - 256)
+            if cache_file is not None
+            else None
+        )
+        if cached is not None:
+            self.token_merges, self.byte_shuffle = cached
+        else:
+            # recover merges and build byte shuffle mapping (due to
+            # historical error in tiktoken)
+            self.token_merges = self._recover_merges(mergeable_ranks)
+            self.byte_shuffle = self._build_byte_shuffle(mergeable_ranks)
         # build inverse byte shuffle mapping due to historical error in tiktoken
         self.inverse_byte_shuffle = self._build_inverse_byte_shuffle()
+        # 256-byte translation tables, applied with bytes.translate()
+        self._byte_shuffle_table: bytes = self._build_translation_table(
+            self.byte_shuffle
+        )
+        self._inverse_byte_shuffle_table: bytes = (
+            self._build_translation_table(self.inverse_byte_shuffle)
+        )
         # register special tokens
         self.register_special_tokens(dict(GPT4Tokenizer._GPT4_SPECIAL_TOKENS))
+        # build the vocabulary once, now that merges, byte shuffle and
+        # special tokens are all in place
+        self.vocab = self._build_vocab()
+        self._reset_caches()
+        if cache_file is not None and cached is None:
+            # failing to write the cache (e.g. read-only home) is not an error
+            with suppress(OSError):
+                self._write_cache(cache_file)
+
+    # Private method to locate the cache file of these ranks, or None when
+    # caching is turned off: the file name carries a hash of the ranks, so
+    # a cache is only ever read back for exactly the ranks it came from
+    def _cache_file(self, mergeable_ranks: dict[bytes, int]) -> str | None:
+        if os.environ.get("MINBPE_NO_CACHE") == "1":
+            return None
+        return os.path.join(
+            self._cache_dir(), f"gpt4-{self._cache_key(mergeable_ranks)}.model"
+        )
+
+    # Private method to hash the ranks into the key of the cache file
+    def _cache_key(self, mergeable_ranks: dict[bytes, int]) -> str:
+        digest = hashlib.sha256()
+        # sorting by rank is cheap: the ranks are already (nearly) in order
+        for token, rank in sorted(mergeable_ranks.items(), key=itemgetter(1)):
+            # length-prefixed, so that no two different vocabs hash alike
+            digest.update(len(token).to_bytes(4, 'little'))
+            digest.update(token)
+            digest.update(rank.to_bytes(8, 'little', signed=True))
+        return digest.hexdigest()
+
+    # Private method to locate the minbpe user cache directory
+    def _cache_dir(self) -> str:
+        cache_home: str = os.environ.get("XDG_CACHE_HOME") or os.path.join(
+            os.path.expanduser("~"), ".cache"
+        )
+        return os.path.join(cache_home, "minbpe")
+
+    # Private method to read the merges and byte shuffle back from a cache
+    # file (a regular model file), or None when it is missing or unusable
+    def _read_cache(
+        self, cache_file: str, num_merges: int
+    ) -> tuple[dict[tuple[int, int], int], dict[int, int]] | None:
+        # a missing, truncated or otherwise malformed file means a rebuild
+        try:
+            with open(cache_file, encoding="utf-8") as f:
+                _, pattern, _, byte_shuffle, merges = self._read_model(f)
+        except (OSError, ValueError):
+            return None
+        # one merge per multi-byte token of the ranks, none lost to a cut
+        if (
+            pattern != GPT4Tokenizer._GPT4_SPLIT_PATTERN_REGEX
+            or len(merges) != num_merges
+        ):
+            return None
+        # every merge must build on tokens that exist before it
+        for (p0, p1), idx in merges.items():
+            if p0 >= idx or p1 >= idx:
+                return None
+        return merges, byte_shuffle
+
+    # Private method to write the cache file atomically: the model goes to
+    # a temporary file that is then renamed over the old one, so a reader
+    # never sees a half-written cache
+    def _write_cache(self, cache_file: str) -> None:
+        # the model layout numbers the merges 256, 257, ... in file order:
+        # merges numbered any other way would not survive the round trip
+        if not all(
+            idx == new_id
+            for new_id, idx in enumerate(self.token_merges.values(), 256)
+        ):
+            return
+        cache_dir: str = os.path.dirname(cache_file)
+        os.makedirs(cache_dir, exist_ok=True)
+        fd, tmp_file = tempfile.mkstemp(dir=cache_dir, suffix=".tmp")
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                self._write_model(f)
+            os.replace(tmp_file, cache_file)
+        except BaseException:
+            with suppress(OSError):
+                os.remove(tmp_file)
+            raise
 
     # Private method to build the vocabulary
     def _build_vocab(self) -> dict[int, bytes]:
-        # Create an empty dictionary to store byte mappings
-        vocab: dict[int, bytes] = {}
-        # Loop through all possible byte values (0 to 255)
-        for byte_value in range(256):
-            # Convert the integer to a single-byte bytes object
-            byte_representation = bytes([byte_value])
-            # Map the integer (key) to its bytes object (value)
-            vocab[byte_value] = byte_representation
+        # Map every byte value (0 to 255) to its shared single-byte object
+        vocab: dict[int, bytes] = dict(enumerate(_BASE_BYTE_VOCAB))
         # loop through token merges to build combined tokens
         for (p0, p1), idx in self.token_merges.items():
             # Ensure inputs are bytes (if vocab might have mixed types)
@@ -65,8 +165,13 @@ class GPT4Tokenizer(RegexTokenizer, metaclass=ConstProtector):
             p1_bytes = vocab[p1]
             vocab[idx] = p0_bytes + p1_bytes
         # Add special tokens to the vocabulary
+        # (stored byte-shuffled like every other token, so that decode's
+        # inverse shuffle turns them back into the special token text)
         for special, idx in self.special_tokens.items():
-            vocab[idx] = special.encode(encoding='utf-8', errors='strict')
+            special_bytes: bytes = special.encode(
+                encoding='utf-8', errors='strict'
+            )
+            vocab[idx] = special_bytes.translate(self._byte_shuffle_table)
         return vocab
 
     # create byte shuffle mapping for correct order single byte,
@@ -76,32 +181,44 @@ class GPT4Tokenizer(RegexTokenizer, metaclass=ConstProtector):
     ) -> dict[int, int]:
         byte_shuffle: dict[int, int] = {}
         for i in range(256):
-            byte_representation: bytes = bytes([i])
+            # shared single-byte object instead of a new bytes([i])
+            byte_representation: bytes = _BASE_BYTE_VOCAB[i]
             byte_shuffle[i] = ranks_tiktoken[byte_representation]
         return byte_shuffle
 
     # create inverse shuffle mapping for correct order single byte,
     # historical error with tiktoken with the ascii order of bytes
     def _build_inverse_byte_shuffle(self) -> dict[int, int]:
-        inverse_byte_shuffle: dict[int, int] = {}
-        for k_byte_shuffle, v_byte_shuffle in self.byte_shuffle.items():
-            inverse_byte_shuffle[v_byte_shuffle] = k_byte_shuffle
-        return inverse_byte_shuffle
+        # swap every (byte, shuffled byte) pair in a single comprehension
+        return {
+            v_byte_shuffle: k_byte_shuffle
+            for k_byte_shuffle, v_byte_shuffle in self.byte_shuffle.items()
+        }
+
+    # flatten a byte -> byte mapping into a table for bytes.translate(),
+    # which permutes a whole buffer in one C call
+    def _build_translation_table(self, byte_map: dict[int, int]) -> bytes:
+        return bytes(byte_map[i] for i in range(256))
 
     def decode(self, ids: list[int]) -> str:
         # we have to un-permute the bytes before we decode
         # Step 1: reconstruct the byte sequence from vocab
-        text_bytes_parts: list[bytes] = []
-        for idx in ids:
-            vocab_entry: bytes = self.vocab[idx]
-            text_bytes_parts.append(vocab_entry)
-        text_bytes: bytes = b"".join(text_bytes_parts)
+        text_bytes: bytearray | None = self._join_vocab_list(ids)
+        if text_bytes is None:
+            # a special token (or an invalid id): only the ids outside the
+            # dense list go through the dict
+            vocab_list: list[bytes] = self._vocab_list
+            num_listed: int = len(vocab_list)
+            text_bytes = bytearray()
+            for idx in ids:
+                if 0 <= idx < num_listed:
+                    text_bytes += vocab_list[idx]
+                else:
+                    text_bytes += self.vocab[idx]
         # Step 2: apply inverse byte shuffle
-        shuffled_bytes: list[int] = []
-        for b in text_bytes:
-            inverse_b: int = self.inverse_byte_shuffle[b]
-            shuffled_bytes.append(inverse_b)
-        text_bytes_final: bytes = bytes(shuffled_bytes)
+        text_bytes_final: bytearray = text_bytes.translate(
+            self._inverse_byte_shuffle_table
+        )
         text: str = text_bytes_final.decode("utf-8", errors="replace")
         return text
 
@@ -117,12 +234,11 @@ class GPT4Tokenizer(RegexTokenizer, metaclass=ConstProtector):
 
     def _encode_chunk(self, text_bytes: bytes) -> list[int]:
         # before we start processing bytes, we have to permute them
+        # (so the parent encode cache is keyed on the permuted bytes)
         # Step 1: apply byte shuffle permutation
-        shuffled_bytes_list: list[int] = []
-        for b in text_bytes:
-            shuffled_value: int = self.byte_shuffle[b]
-            shuffled_bytes_list.append(shuffled_value)
-        shuffled_text_bytes: bytes = bytes(shuffled_bytes_list)
+        shuffled_text_bytes: bytes = text_bytes.translate(
+            self._byte_shuffle_table
+        )
         ids: list[int] = super()._encode_chunk(shuffled_text_bytes)
         return ids
 
@@ -135,12 +251,24 @@ class GPT4Tokenizer(RegexTokenizer, metaclass=ConstProtector):
         # also see https://github.com/openai/tiktoken/issues/60
         # also see https://github.com/karpathy/minbpe/issues/11#issuecomment-1950805306
         merges: dict[tuple[int, int], int] = {}
+        # memo of (left rank, right rank) -> rank of the concatenation,
+        # shared by every _byte_pair_encoding call below
+        pair_ranks: dict[tuple[int, int], int] = {}
         for token, rank in mergeable_ranks.items():
             if len(token) == 1:
                 # skip raw bytes, this is only for merged tokens
                 continue
+            # the pair BPE recovers is always some split of the token into
+            # two tokens of lower rank; usually only one such split exists,
+            # and then it is the answer without running BPE over the token
+            split_ranks: tuple[int, int] | None = self._unique_split(
+                mergeable_ranks, token, rank
+            )
+            if split_ranks is not None:
+                merges[split_ranks] = rank
+                continue
             bpe_pair: list[bytes] = self._byte_pair_encoding(
-                mergeable_ranks, token, max_rank=rank
+                mergeable_ranks, token, max_rank=rank, pair_ranks=pair_ranks
             )
             if len(bpe_pair) != 2:
                 raise ValueError(
@@ -155,11 +283,34 @@ class GPT4Tokenizer(RegexTokenizer, metaclass=ConstProtector):
             merges[ranks] = rank
         return merges
 
+    # Private method to find the only way to split a token into two tokens
+    def _unique_split(
+        self, mergeable_ranks: dict[bytes, int], token: bytes, max_rank: int
+    ) -> tuple[int, int] | None:
+        """Return the ranks of (left, right) if token splits into two
+        parts in exactly one way such that each part is a single byte or a
+        token ranked below max_rank, else None.
+        """
+        last: int = len(token) - 1
+        found: tuple[int, int] | None = None
+        for split in range(1, len(token)):
+            left_rank: int = mergeable_ranks.get(token[:split], -1)
+            if left_rank < 0 or (left_rank >= max_rank and split > 1):
+                continue
+            right_rank: int = mergeable_ranks.get(token[split:], -1)
+            if right_rank < 0 or (right_rank >= max_rank and split < last):
+                continue
+            if found is not None:
+                return None  # ambiguous: let BPE decide
+            found = (left_rank, right_rank)
+        return found
+
     def _byte_pair_encoding(
         self,
         mergeable_ranks: dict[bytes, int],
         token: bytes,
         max_rank: int | None = None,
+        pair_ranks: dict[tuple[int, int], int] | None = None,
     ) -> list[bytes]:
         """
         Reconstructs how a byte token would be split (or merged) according to
@@ -169,40 +320,114 @@ class GPT4Tokenizer(RegexTokenizer, metaclass=ConstProtector):
             mergeable_ranks: Mapping from byte sequences to integer ranks.
             token: A single token as a bytes object (e.g. b'hello').
             max_rank: Optional cutoff; merges with rank >= max_rank are skipped.
+            pair_ranks: Optional memo of (left rank, right rank) -> rank of
+                the two parts joined (-1 if that is not a token). Sharing
+                it across calls replaces most bytes concatenations and bytes
+                hashing with a lookup on a tuple of two ints.
 
         Returns:
             A list of bytes objects representing the token split into
             mergeable subparts.
         """
+        if pair_ranks is None:
+            pair_ranks = {}
+        num_bytes: int = len(token)
+        # every part is tracked by its rank and keyed by its start: part i
+        # is token[i:next_start[i]], and merged-away parts get rank -1
+        # (iterating bytes gives ints: index the shared single-byte objects
+        # instead of slicing a new one out of the token per byte)
+        part_ranks: list[int] = []
+        for byte_value in token:
+            part_ranks.append(mergeable_ranks[_BASE_BYTE_VOCAB[byte_value]])
+        next_start: list[int] = list(range(1, num_bytes + 1))
+        prev_start: list[int] = list(range(-1, num_bytes - 1))
+        # min-heap of (rank, start) for every adjacent pair that is a token:
+        # popping it gives the lowest rank and, on ties, the leftmost pair,
+        # the same choice as scanning all the pairs on every merge
+        heap: list[tuple[int, int]] = []
+        for i in range(num_bytes - 1):
+            rank: int = self._pair_rank(
+                mergeable_ranks,
+                pair_ranks,
+                token,
+                part_ranks,
+                i,
+                i + 1,
+                next_start[i + 1],
+            )
+            if rank >= 0 and (max_rank is None or rank < max_rank):
+                heap.append((rank, i))
+        heapq.heapify(heap)
+        while heap:
+            min_rank, left = heapq.heappop(heap)
+            right: int = next_start[left]
+            # skip entries made stale by an earlier merge: the left part is
+            # gone, or the pair starting there is no longer the same one
+            if part_ranks[left] < 0 or right >= num_bytes:
+                continue
+            if pair_ranks[(part_ranks[left], part_ranks[right])] != min_rank:
+                continue
+            # Combine the two parts into one: the merged part takes the rank
+            # of the pair and the start of its left half
+            part_ranks[left] = min_rank
+            part_ranks[right] = -1
+            after: int = next_start[right]
+            next_start[left] = after
+            # only the pairs touching the merged part can change
+            if after < num_bytes:
+                prev_start[after] = left
+                rank = self._pair_rank(
+                    mergeable_ranks,
+                    pair_ranks,
+                    token,
+                    part_ranks,
+                    left,
+                    after,
+                    next_start[after],
+                )
+                if rank >= 0 and (max_rank is None or rank < max_rank):
+                    heapq.heappush(heap, (rank, left))
+            before: int = prev_start[left]
+            if before >= 0:
+                rank = self._pair_rank(
+                    mergeable_ranks,
+                    pair_ranks,
+                    token,
+                    part_ranks,
+                    before,
+                    left,
+                    after,
+                )
+                if rank >= 0 and (max_rank is None or rank < max_rank):
+                    heapq.heappush(heap, (rank, before))
+        # only now turn the parts back into bytes
         parts: list[bytes] = []
-        for parts_byte in token:
-            parts_byte_representation: bytes = bytes([parts_byte])
-            parts.append(parts_byte_representation)
-        while True:
-            min_idx: int | None = None
-            min_rank: int | None = None
-            for i in range(len(parts) - 1):
-                left: bytes = parts[i]
-                right: bytes = parts[i + 1]
-                pair_bytes: bytes = left + right
-                rank = mergeable_ranks.get(pair_bytes)
-                if rank is not None and (min_rank is None or rank < min_rank):
-                    min_idx = i
-                    min_rank = rank
-            if min_rank is None or (
-                max_rank is not None and min_rank >= max_rank
-            ):
-                break
-            if min_idx is None:
-                raise ValueError("Expected min_idx to be set, got None")
-            left_part = parts[:min_idx]  # Everything before the pair to merge
-            merged_pair = (
-                parts[min_idx] + parts[min_idx + 1]
-            )  # Combine the two parts into one
-            right_part = parts[min_idx + 2 :]  # Everything after the pair
-            parts = left_part + [merged_pair] + right_part  # Rebuild the list
+        i = 0
+        while i < num_bytes:
+            parts.append(token[i : next_start[i]])
+            i = next_start[i]
         return parts
 
+    # Private method to get the rank of the part starting at left joined
+    # with the part starting at right (and ending at end), -1 if not a token
+    def _pair_rank(
+        self,
+        mergeable_ranks: dict[bytes, int],
+        pair_ranks: dict[tuple[int, int], int],
+        token: bytes,
+        part_ranks: list[int],
+        left: int,
+        right: int,
+        end: int,
+    ) -> int:
+        ranks_key: tuple[int, int] = (part_ranks[left], part_ranks[right])
+        rank: int | None = pair_ranks.get(ranks_key)
+        if rank is None:
+            # first time these two parts meet: look up their bytes
+            rank = mergeable_ranks.get(token[left:end], -1)
+            pair_ranks[ranks_key] = rank
+        return rank
+
     def _save_model_file(self, save_dir: str, file_prefix: str) -> None:
         """
         Saves a model file for GPT4Tokenizer that contains:
@@ -218,24 +443,29 @@ class GPT4Tokenizer(RegexTokenizer, metaclass=ConstProtector):
         model_file_prefix: str = file_prefix + ".model"
         model_file: str = os.path.join(save_dir, model_file_prefix)
         with open(model_file, 'w', encoding='utf-8') as f:
-            # name and version
-            f.write("minbpe v1\n")
-            # text source
-            f.write(f"{self.source}\n")
-            # regex pattern
-            f.write(f"{self.pattern}\n")
-            # write special tokens
-            f.write(f"{len(self.special_tokens)}\n")
-            for special, idx in self.special_tokens.items():
-                f.write(f"{special} {idx}\n")
-            # byte shuffle (256 entries)
-            f.write("256\n")
-            for raw_byte in range(256):
-                mapped = self.byte_shuffle[raw_byte]
-                f.write(f"{raw_byte} {mapped}\n")
-            # write token merges
-            for idx1, idx2 in self.token_merges:
-                f.write(f"{idx1} {idx2}\n")
+            self._write_model(f)
+
+    # Private method to write the model file layout to f (shared by save()
+    # and the user cache)
+    def _write_model(self, f: TextIO) -> None:
+        # name and version
+        f.write("minbpe v1\n")
+        # text source
+        f.write(f"{self.source}\n")
+        # regex pattern
+        f.write(f"{self.pattern}\n")
+        # write special tokens
+        f.write(f"{len(self.special_tokens)}\n")
+        for special, idx in self.special_tokens.items():
+            f.write(f"{special} {idx}\n")
+        # byte shuffle (256 entries)
+        f.write("256\n")
+        for raw_byte in range(256):
+            mapped = self.byte_shuffle[raw_byte]
+            f.write(f"{raw_byte} {mapped}\n")
+        # write token merges
+        for idx1, idx2 in self.token_merges:
+            f.write(f"{idx1} {idx2}\n")
 
     def _save_vocab_file(self, save_dir: str, file_prefix: str) -> None:
         # just for visualization purposes let's output the GPT-4 tokens
@@ -248,30 +478,37 @@ class GPT4Tokenizer(RegexTokenizer, metaclass=ConstProtector):
             raise FileNotFoundError(f"Directory does not exist: {save_dir}")
         vocab_file_prefix: str = file_prefix + ".vocab"
         vocab_file: str = os.path.join(save_dir, vocab_file_prefix)
+        # un-permute every token with one bytes.translate call instead of
+        # mapping single bytes and concatenating them up the merge tree
+        inverse_table: bytes = self._inverse_byte_shuffle_table
         vocab: dict[int, bytes] = {}
         for idx in range(256):
-            byte_representation: bytes = bytes(
-                [self.inverse_byte_shuffle[idx]]
-            )
-            self.vocab[idx] = byte_representation
-        for (p0, p1), idx in self.token_merges.items():
-            vocab[idx] = vocab[p0] + vocab[p1]
+            vocab[idx] = self.vocab[idx].translate(inverse_table)
+        for idx in self.token_merges.values():
+            vocab[idx] = self.vocab[idx].translate(inverse_table)
         # now merge the shuffled bytes and write to file
         inverted_merges: dict[int, tuple[int, int]] = {}
         for pair, idx in self.token_merges.items():
             inverted_merges[idx] = pair
+        # render every token once, children included
+        render = self._render_token
+        rendered: dict[int, str] = {
+            idx: render(token) for idx, token in vocab.items()
+        }
+        lines: list[str] = []
+        for idx, token_string in rendered.items():
+            if idx in inverted_merges:
+                idx0, idx1 = inverted_merges[idx]
+                token_pair_1: str = rendered[idx0]
+                token_pair_2: str = rendered[idx1]
+                lines.append(
+                    f"[{token_pair_1}][{token_pair_2}] -> [{token_string}] {idx}\n"
+                )
+            else:
+                lines.append(f"[{token_string}] {idx}\n")
+        # hand the whole file to the buffered writer in one call
         with open(vocab_file, "w", encoding="utf-8") as f:
-            for idx, token in vocab.items():
-                token_string: str = self._render_token(token)
-                if idx in inverted_merges:
-                    idx0, idx1 = inverted_merges[idx]
-                    token_pair_1 = self._render_token(vocab[idx0])
-                    token_pair_2 = self._render_token(vocab[idx1])
-                    f.write(
-                        f"[{token_pair_1}][{token_pair_2}] -> [{token_string}] {idx}\n"
-                    )
-                else:
-                    f.write(f"[{token_string}] {idx}\n")
+            f.writelines(lines)
 
     def load(self, model_path: str, model_filename: str) -> None:
         """Load the values of model file to the tokenizer"""
@@ -282,57 +519,72 @@ class GPT4Tokenizer(RegexTokenizer, metaclass=ConstProtector):
         if not os.path.exists(model_full_path):
             raise FileNotFoundError(f"Model file not found: {model_path}")
         # read the model file
-        merges: dict[tuple[int, int], int] = {}
-        special_tokens: dict[str, int] = {}
-        idx: int = 256
         with open(model_full_path, encoding="utf-8") as f:
-            # read the version
-            version = f.readline().strip()
-            if version != "minbpe v1":
-                raise ValueError(f"Unsupported model version: {version}")
-            # read the source
-            self.source = f.readline().strip()
-            # read the regex pattern
-            self.pattern = f.readline().strip()
-            try:
-                self.compiled_pattern = regex.compile(self.pattern)
-            except regex.error as e:
-                raise ValueError(
-                    f"Invalid regex pattern in model file: {e}"
-                ) from e
-            # read the number of special tokens
-            num_special_str: str = f.readline().strip()
-            num_special: int = int(num_special_str)
-            for _ in range(num_special):
-                special, special_idx = f.readline().strip().split()
-                special_tokens[special] = int(special_idx)
-            # read the byte shuffle mapping
-            num_shuffle = int(f.readline().strip())
-            if num_shuffle != 256:
-                raise ValueError("Expected byte shuffle table of length 256")
-            byte_shuffle: dict[int, int] = {}
-            for _ in range(num_shuffle):
-                raw_str, mapped_str = f.readline().strip().split()
-                raw = int(raw_str)
-                mapped = int(mapped_str)
-                byte_shuffle[raw] = mapped
-            self.byte_shuffle = byte_shuffle
-            # read the inverse byte shuffle mapping
-            inverse: dict[int, int] = {}
-            for raw, mapped in byte_shuffle.items():
-                inverse[mapped] = raw
-            self.inverse_byte_shuffle = inverse
-            # read the merges
-            for line in f:
-                # Each line should contain two token IDs separated by a space
-                left_token_str, right_token_str = line.strip().split()
-                # Convert both IDs to integers
-                left_token = int(left_token_str)
-                right_token = int(right_token_str)
-                # Register this merge pair with a new token ID
-                merges[(left_token, right_token)] = idx
-                idx += 1
+            source, pattern, special_tokens, byte_shuffle, merges = (
+                self._read_model(f)
+            )
+        self.source = source
+        self.pattern = pattern
+        try:
+            self.compiled_pattern = _compile_pattern(self.pattern)
+        except regex.error as e:
+            raise ValueError(
+                f"Invalid regex pattern in model file: {e}"
+            ) from e
+        self.byte_shuffle = byte_shuffle
+        # read the inverse byte shuffle mapping
+        self.inverse_byte_shuffle = self._build_inverse_byte_shuffle()
+        self._byte_shuffle_table = self._build_translation_table(byte_shuffle)
+        self._inverse_byte_shuffle_table = self._build_translation_table(
+            self.inverse_byte_shuffle
+        )
         self.token_merges = merges
-        self.special_tokens = special_tokens
+        self.register_special_tokens(special_tokens)
         # Rebuild vocabulary (uses merges + byte shuffle logic)
         self.vocab = self._build_vocab()
+        self._reset_caches()
+
+    # Private method to parse the model file layout written by _write_model
+    def _read_model(self, f: TextIO) -> tuple[
+        str,
+        str,
+        dict[str, int],
+        dict[int, int],
+        dict[tuple[int, int], int],
+    ]:
+        """Read source, pattern, special tokens, byte shuffle and merges
+        from f, raising ValueError on anything malformed.
+        """
+        # read the version
+        version = f.readline().strip()
+        if version != "minbpe v1":
+            raise ValueError(f"Unsupported model version: {version}")
+        # read the source
+        source: str = f.readline().strip()
+        # read the regex pattern
+        pattern: str = f.readline().strip()
+        # read the number of special tokens
+        num_special_str: str = f.readline().strip()
+        num_special: int = int(num_special_str)
+        special_tokens: dict[str, int] = {}
+        for _ in range(num_special):
+            special, special_idx = f.readline().strip().split()
+            special_tokens[special] = int(special_idx)
+        # read the byte shuffle mapping
+        num_shuffle = int(f.readline().strip())
+        if num_shuffle != 256:
+            raise ValueError("Expected byte shuffle table of length 256")
+        byte_shuffle: dict[int, int] = {}
+        for _ in range(num_shuffle):
+            raw_str, mapped_str = f.readline().strip().split()
+            raw = int(raw_str)
+            mapped = int(mapped_str)
+            byte_shuffle[raw] = mapped
+        # the shuffle must be a permutation of the 256 byte values
+        if sorted(byte_shuffle) != list(range(256)) or sorted(
+            byte_shuffle.values()
+        ) != list(range(256)):
+            raise ValueError("Byte shuffle is not a permutation of 0..255")
+        # read the merges
+        merges: dict[tuple[int, int], int] = self._read_merges(f)
+        return source, pattern, special_tokens, byte_shuffle, merges
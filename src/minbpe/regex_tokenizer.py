@@ -1,13 +1,86 @@
 """Regex Tokenizer implementation."""
 
+import multiprocessing
 import os
-from typing import Final, Literal
+import sys
+import threading
+from array import array
+from collections import Counter, OrderedDict
+from collections.abc import Iterable, Iterator
+from concurrent.futures import (
+    Executor,
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+)
+from operator import methodcaller
+from typing import Any, Final, Literal
 
 import regex
 
+try:
+    # optional PCRE2 (JIT) backend for splitting, see _split_text
+    import pcre2
+except ImportError:
+    pcre2 = None
+
 from minbpe.base_tokenizer import BaseTokenizer
 from minbpe.const_protector import ConstProtector
 
+# split pattern -> compiled pattern, shared by every tokenizer instance so
+# that each distinct pattern is compiled once per process
+_COMPILED_PATTERN_CACHE: dict[str, regex.Pattern] = {}
+
+
+# Private function to compile a split pattern through the shared cache
+def _compile_pattern(pattern: str) -> regex.Pattern:
+    compiled: regex.Pattern | None = _COMPILED_PATTERN_CACHE.get(pattern)
+    if compiled is None:
+        compiled = regex.compile(pattern)
+        _COMPILED_PATTERN_CACHE[pattern] = compiled
+    return compiled
+
+
+# opt in with MINBPE_BACKEND=pcre2 (needs the pcre2 package installed)
+_USE_PCRE2: Final[bool] = (
+    os.environ.get("MINBPE_BACKEND") == "pcre2" and pcre2 is not None
+)
+
+# split pattern -> PCRE2 JIT pattern, or None where PCRE2 rejects it
+_PCRE2_PATTERN_CACHE: dict[str, Any] = {}
+
+
+# Private function to compile a split pattern for PCRE2 through its cache
+def _compile_pcre2_pattern(pattern: str) -> Any:
+    if pattern not in _PCRE2_PATTERN_CACHE:
+        try:
+            # (*UCP) gives \s, \d and \w the Unicode meaning they have in
+            # the regex module, so both backends split text the same way
+            compiled: Any = pcre2.compile("(*UCP)" + pattern, jit=True)
+        except Exception:
+            compiled = None  # not PCRE2 syntax: keep using the regex module
+        _PCRE2_PATTERN_CACHE[pattern] = compiled
+    return _PCRE2_PATTERN_CACHE[pattern]
+
+
+# the whole text of a match object
+_match_group: Final[methodcaller] = methodcaller("group")
+
+# thread pool encode_ordinary spreads the chunks of long texts over,
+# created on first use (only ever on free-threaded builds)
+_chunk_executor: ThreadPoolExecutor | None = None
+_chunk_executor_lock: threading.Lock = threading.Lock()
+
+
+# Private function to get the shared chunk thread pool
+def _get_chunk_executor() -> ThreadPoolExecutor:
+    global _chunk_executor
+    with _chunk_executor_lock:
+        if _chunk_executor is None:
+            _chunk_executor = ThreadPoolExecutor(
+                max_workers=os.process_cpu_count()
+            )
+        return _chunk_executor
+
 
 class RegexTokenizer(BaseTokenizer, metaclass=ConstProtector):
 
@@ -20,6 +93,38 @@ class RegexTokenizer(BaseTokenizer, metaclass=ConstProtector):
         r"""'(?i:[sdmt]|ll|ve|re)|[^\r\n\p{L}\p{N}]?+\p{L}+|\p{N}{1,3}| ?[^\s\p{L}\p{N}]++[\r\n]*|\s*[\r\n]|\s+(?!\S)|\s+"""
     )
 
+    # the built-in split patterns, compiled at import time (this also
+    # seeds the shared cache for GPT4Tokenizer and the default pattern)
+    _GPT2_SPLIT_REGEX: Final[regex.Pattern] = _compile_pattern(
+        _GPT2_SPLIT_PATTERN
+    )
+
+    _GPT4_SPLIT_REGEX: Final[regex.Pattern] = _compile_pattern(
+        _GPT4_SPLIT_PATTERN
+    )
+
+    # maximum number of chunk encodings kept in the LRU encode cache
+    _ENCODE_CACHE_SIZE: Final[int] = 2**16
+
+    # texts longer than this (in characters) are split lazily by
+    # encode_ordinary, to keep its peak memory down
+    _STREAM_TEXT_LENGTH: Final[int] = 2**20
+
+    # texts split into more chunks than this are encoded on several threads
+    # when the GIL is disabled
+    _PARALLEL_CHUNK_THRESHOLD: Final[int] = 64
+
+    # batches shorter than this in total (in characters) are encoded
+    # serially by encode_batch instead of on threads: a thread pool starts
+    # in ~0.15 ms, the time to encode ~1k characters
+    _THREAD_BATCH_LENGTH: Final[int] = 2**14
+
+    # the same for worker processes: each one takes ~0.1-0.2 s to spawn and
+    # receive the tokenizer, and then encodes at its cold-cache speed
+    # (~2x slower per character than a warm cache), so processes only pay
+    # off for batches of a few million characters
+    _PROCESS_BATCH_LENGTH: Final[int] = 2**22
+
     def __init__(self, pattern: str | None = None) -> None:
         """
         - pattern: optional string to override the default (GPT-4 split pattern)
@@ -30,13 +135,38 @@ class RegexTokenizer(BaseTokenizer, metaclass=ConstProtector):
         self.pattern: str = (
             RegexTokenizer._GPT4_SPLIT_PATTERN if pattern is None else pattern
         )
-        self.compiled_pattern: regex.Pattern = regex.compile(self.pattern)
+        self.compiled_pattern: regex.Pattern = _compile_pattern(self.pattern)
         # special_tokens is already defined in BaseTokenizer, but we
         # initialize it here to an empty dict for clarity
         # special_tokens is for encoding
         self.special_tokens: dict[str, int] = {}
         # inverse_special_tokens is for decoding
         self.inverse_special_tokens: dict[int, str] = {}
+        # splits text around every registered special token, built once in
+        # register_special_tokens (None while there are none)
+        self._special_pattern: regex.Pattern | None = None
+        # the same for each subset of special tokens passed to encode() as
+        # allowed_special, compiled the first time that subset is seen
+        self._special_pattern_cache: dict[frozenset[str], regex.Pattern] = {}
+        # lookup tables derived from vocab / token_merges, see _reset_caches
+        self._vocab_index: dict[bytes, int] = {}
+        # LRU cache of chunk encodings, shared by every thread that encodes
+        # with this tokenizer (encode_batch, encode_ordinary without a GIL):
+        # every access holds _encode_cache_lock, as an OrderedDict is not
+        # safe to mutate from several threads at once
+        self._encode_cache: OrderedDict[bytes, tuple[int, ...]] = OrderedDict()
+        self._encode_cache_lock: threading.Lock = threading.Lock()
+        self._reset_caches()
+
+    def __getstate__(self) -> dict[str, Any]:
+        # a lock can be neither pickled nor copied: copies get their own
+        state: dict[str, Any] = self.__dict__.copy()
+        del state['_encode_cache_lock']
+        return state
+
+    def __setstate__(self, state: dict[str, Any]) -> None:
+        self.__dict__.update(state)
+        self._encode_cache_lock = threading.Lock()
 
     def train(
         self,
@@ -58,80 +188,42 @@ class RegexTokenizer(BaseTokenizer, metaclass=ConstProtector):
         num_merges: int = vocab_size - 256
 
         # split the text up into text chunks
-        text_chunks: list[str] = regex.findall(self.compiled_pattern, text)
-        # input text preprocessing
-        ids: list[list[int]] = []  # list of list of integers in range 0..255
-        for chunk in text_chunks:
-            # Convert each chunk (string) into a UTF-8 encoded bytes object
-            chunk_bytes: bytes = chunk.encode(
-                "utf-8", errors="strict"
-            )  # raw bytes
-            # Convert the bytes object into a list of integer byte values (0–255)
-            chunk_ids: list[int] = list(chunk_bytes)
-            # Add the result to the main list
-            ids.append(chunk_ids)
+        text_chunks: list[str] = self._split_text(text)
+        # input text preprocessing: identical chunks are collapsed into one
+        # word with its corpus frequency, so merging only ever walks the
+        # unique words instead of every token in the text
+        # (each chunk as its UTF-8 bytes, encoded and tallied in C by
+        # Counter, which keeps the words in order of first occurrence)
+        word_freq: Counter[bytes] = Counter(map(str.encode, text_chunks))
+        word_freq.pop(b"", None)  # an empty match has no pairs
+        # lay the words end to end in one linked list of ids; pairs never
+        # span two words, so every word starts and ends a run (-1 links)
+        ids: array[int] = array('i')
+        weights: array[int] = array('i')  # frequency of each id's word
+        for word, freq in word_freq.items():
+            # (iterate the bytes: array() would reinterpret a bytes buffer)
+            ids.extend(iter(word))
+            weights.extend(array('i', [freq]) * len(word))
+        num_ids: int = len(ids)
+        prev_pos: array[int] = array('i', range(-1, num_ids - 1))
+        next_pos: array[int] = array('i', range(1, num_ids + 1))
+        word_start: int = 0
+        for word in word_freq:
+            word_end: int = word_start + len(word)
+            prev_pos[word_start] = -1
+            next_pos[word_end - 1] = -1
+            word_start = word_end
         # iteratively merge the most common pairs to create new tokens
-        merges: dict[tuple[int, int], int] = {}  # (int, int) -> int
-        vocab: dict[int, bytes] = {}  # int -> bytes
-        for vocab_idx in range(256):
-            byte_representation: bytes = bytes([vocab_idx])
-            vocab[vocab_idx] = byte_representation
-        for i in range(num_merges):
-            # count the number of times every consecutive pair appears
-            stats: dict[tuple[int, int], int] = {}
-            for chunk_ids in ids:
-                # passing in stats will update it in place, adding up counts
-                chunk_stats: dict[tuple[int, int], int] = self._get_stats(
-                    chunk_ids
-                )
-                # Merge the chunk's stats into the global stats dictionary
-                for stat_pair, count in chunk_stats.items():
-                    # If this pair already exists in the global dictionary, add to its count
-                    if stat_pair in stats:
-                        stats[stat_pair] += count
-                    # Otherwise, start counting this pair from this chunk's count
-                    else:
-                        stats[stat_pair] = count
-            # find the pair with the highest count
-            most_frequent_pair: tuple[int, int] | None
-            highest_count: int
-            most_frequent_pair, highest_count = self._get_most_frequent_pair(
-                stats
-            )
-            if highest_count <= 0 or most_frequent_pair is None:
-                # no more pairs can be merged
-                if verbose:
-                    print(
-                        f"No more pairs can be merged at iteration {i}. Stopping early."
-                    )
-                break
-            pair: tuple[int, int] = most_frequent_pair
-            # mint a new token: assign it the next available id
-            idx: int = 256 + i
-            # replace all occurrences of pair in ids with idx
-            # For every list of token IDs (chunk) in ids
-            updated_ids: list[list[int]] = []
-            for chunk_ids in ids:
-                # Merge all occurrences of the current pair into a new token ID
-                merged_chunk: list[int] = self._merge(chunk_ids, pair, idx)
-                # Add the merged chunk to the updated list
-                updated_ids.append(merged_chunk)
-            # Replace the old ids with the updated ones
-            ids = updated_ids
-            # save the merge
-            merges[pair] = idx
-            left_token: bytes = vocab[pair[0]]
-            right_token: bytes = vocab[pair[1]]
-            vocab[idx] = left_token + right_token
-            # prints
-            if verbose:
-                print(
-                    f"merge {i+1}/{num_merges}: {pair} -> {idx} ({vocab[idx]!r}) had {stats[pair]} occurrences"
-                )
+        merges: dict[tuple[int, int], int]  # (int, int) -> int
+        vocab: dict[int, bytes]  # int -> bytes
+        merges, vocab = self._learn_merges(
+            ids, prev_pos, next_pos, weights, num_merges, verbose
+        )
 
         # save class variables
         self.token_merges = merges  # used in encode()
         self.vocab = vocab  # used in decode()
+        self._reset_caches()
 
     def register_special_tokens(self, special_tokens: dict[str, int]) -> None:
         """
@@ -146,7 +238,8 @@ class RegexTokenizer(BaseTokenizer, metaclass=ConstProtector):
                     }
 
         This method also creates an inverse mapping (int -> str)
-        to allow decoding IDs back into their special token strings.
+        to allow decoding IDs back into their special token strings, and
+        compiles the pattern encode() uses to split text around them.
         """
         self.special_tokens = special_tokens
         # Initialize an empty dictionary for the inverse mapping
@@ -156,79 +249,233 @@ class RegexTokenizer(BaseTokenizer, metaclass=ConstProtector):
             # Add the reversed mapping: token_id -> token_str
             inv_special_tokens[token_id] = token_str
         self.inverse_special_tokens = inv_special_tokens
+        # compile the split pattern here rather than on every encode() call
+        self._special_pattern = (
+            self._compile_special_pattern(special_tokens)
+            if special_tokens
+            else None
+        )
+        # patterns for subsets of the previous special tokens are stale
+        self._special_pattern_cache = {}
+
+    # Private method to build the pattern that splits text on special tokens
+    def _compile_special_pattern(
+        self, special_tokens: Iterable[str]
+    ) -> regex.Pattern:
+        # we handle special tokens by splitting the text
+        # based on the occurrence of any exact match with any of the special tokens
+        # we can use re.split for this. note that surrounding the pattern with ()
+        # makes it into a capturing group, so the special tokens will be included
+        # Create an empty list to hold the escaped special tokens
+        escaped_tokens: list[str] = []
+        for key_special in special_tokens:
+            # This ensures characters like '|' are treated as literal text, not regex commands.
+            escaped_k: str = regex.escape(key_special)
+            escaped_tokens.append(escaped_k)
+        # Join all the escaped tokens together with the "|" (OR) operator
+        # This builds the core of the pattern: "<\|user\|>|<\|bot\|>|..."
+        inner_pattern: str = "|".join(escaped_tokens)
+        special_pattern: str = "(" + inner_pattern + ")"
+        return regex.compile(special_pattern)
 
     def decode(self, ids: list[int]) -> str:
         # given ids (list of integers), return Python string
-        part_bytes: list[bytes] = []
+        fast_bytes: bytearray | None = self._join_vocab_list(ids)
+        if fast_bytes is not None:
+            return fast_bytes.decode("utf-8", errors="replace")
+        # some id is not in the dense list (a special token or an invalid
+        # id): go id by id, still taking every id it covers from the list
+        vocab_list: list[bytes] = self._vocab_list
+        num_listed: int = len(vocab_list)
+        text_bytes: bytearray = bytearray()
         for idx in ids:
-            if idx in self.vocab:
-                part_bytes.append(self.vocab[idx])
+            if 0 <= idx < num_listed:
+                text_bytes += vocab_list[idx]
+            elif idx in self.vocab:
+                text_bytes += self.vocab[idx]
             elif idx in self.inverse_special_tokens:
                 special_token_str: str = self.inverse_special_tokens[idx]
-                part_bytes.append(
-                    special_token_str.encode("utf-8", errors="strict")
+                text_bytes += special_token_str.encode(
+                    "utf-8", errors="strict"
                 )
             else:
                 raise ValueError(f"invalid token id: {idx}")
-        text_bytes: bytes = b"".join(part_bytes)
         text: str = text_bytes.decode("utf-8", errors="replace")
         return text
 
+    def _reset_caches(self) -> None:
+        """Rebuild the lookup tables derived from vocab and token_merges.
+        Must be called whenever the merges change (train, load, ...).
+        """
+        super()._reset_caches()
+        # bytes -> id of every ordinary (non-special) token
+        vocab_index: dict[bytes, int] = {}
+        for idx in range(256):
+            vocab_index[self.vocab[idx]] = idx
+        for idx in self.token_merges.values():
+            vocab_index[self.vocab[idx]] = idx
+        self._vocab_index = vocab_index
+        # encodings computed with the previous merges are no longer valid
+        self._encode_cache = OrderedDict()
+
     def _encode_chunk(self, text_bytes: bytes) -> list[int]:
+        # fast path: a chunk that is already a single token needs no merging
+        # (tiktoken does the same); with the GPT-4 split pattern this covers
+        # most common words
+        token: int | None = self._vocab_index.get(text_bytes)
+        if token is not None:
+            return [token]
+        if len(text_bytes) <= 2:
+            # a pair of bytes that is not a token has no merge (its merge
+            # would be that token), and shorter chunks have nothing to merge:
+            # the bytes are the ids, no cache or heap needed
+            return list(text_bytes)
+        # natural text is Zipfian: most chunks have been encoded before
+        # (the lock is only held for the lookups, never for the merging)
+        with self._encode_cache_lock:
+            cached: tuple[int, ...] | None = self._encode_cache.get(text_bytes)
+            if cached is not None:
+                self._encode_cache.move_to_end(text_bytes)
+        if cached is not None:
+            return list(cached)
+        ids: list[int] = self._encode_chunk_bpe(text_bytes)
+        with self._encode_cache_lock:
+            self._encode_cache[text_bytes] = tuple(ids)
+            if len(self._encode_cache) > RegexTokenizer._ENCODE_CACHE_SIZE:
+                # evict the least recently used chunk
+                self._encode_cache.popitem(last=False)
+        return ids
+
+    def _encode_chunk_bpe(self, text_bytes: bytes) -> list[int]:
         # return the token ids
         # let's begin. first, convert all bytes to integers in range 0..255
         ids: list[int] = list(text_bytes)
-        while len(ids) >= 2:
-            # find the pair with the lowest merge index
-            stats: dict[tuple[int, int], int] = self._get_stats(ids)
-            # collect all current pairs ---
-            pairs_list: list[tuple[int, int]] = list(stats.keys())
-            # assign each pair its merge priority ---
-            pair_priorities: dict[tuple[int, int], float | int] = {}
-            for p in pairs_list:
-                if p in self.token_merges:
-                    pair_priorities[p] = self.token_merges[p]
-                else:
-                    pair_priorities[p] = float("inf")
-            # initialize variables to track the best pair and its smallest priority
-            best_pair: tuple[int, int] | None = None
-            best_priority: float | int = float("inf")
-            # find the pair with the smallest merge index ---
-            for p in pair_priorities:
-                priority: float | int = pair_priorities[p]
-                if priority < best_priority:
-                    best_priority = priority
-                    best_pair = p
-            if best_pair is None:
-                # No pairs to merge
-                break
-            pair: tuple[int, int] = best_pair
-            # subtle: if there are no more merges available, the key will
-            # result in an inf for every single pair, and the min will be
-            # just the first pair in the list, arbitrarily
-            # we can detect this terminating case by a membership check
-            if pair not in self.token_merges:
-                break  # nothing else can be merged anymore
-            # otherwise let's merge the best pair (lowest merge index)
-            idx: int = self.token_merges[pair]
-            merged_ids: list[int] = self._merge(ids, pair, idx)
-            ids: list[int] = merged_ids  # type: ignore[no-redef]
-        return ids
+        # then apply the merges in order of merge index with the heap-based
+        # linked list shared with BasicTokenizer: each merge only touches
+        # its neighbours instead of recounting every pair of the chunk
+        return self._apply_merges(ids)
+
+    # Private method to split text into chunks with the split pattern
+    def _split_text(self, text: str) -> list[str]:
+        if _USE_PCRE2:
+            pcre2_pattern: Any = _compile_pcre2_pattern(self.pattern)
+            if pcre2_pattern is not None:
+                return [
+                    match.group() for match in pcre2_pattern.finditer(text)
+                ]
+        # (call the compiled pattern directly: regex.findall would look it
+        # up in the module's pattern cache on every call)
+        text_chunks: list[str] = self.compiled_pattern.findall(text)
+        return text_chunks
+
+    # Private method to yield the chunks of text one at a time, in the same
+    # order _split_text returns them, without holding them all in memory
+    def _iter_text(self, text: str) -> Iterator[str]:
+        # (map() with methodcaller pulls each match's text in C, cheaper
+        # than resuming a Python generator per chunk)
+        if _USE_PCRE2:
+            pcre2_pattern: Any = _compile_pcre2_pattern(self.pattern)
+            if pcre2_pattern is not None:
+                return map(_match_group, pcre2_pattern.finditer(text))
+        return map(_match_group, self.compiled_pattern.finditer(text))
 
     def encode_ordinary(self, text: str) -> list[int]:
         """Encoding that ignores any special tokens."""
+        workers: int = os.process_cpu_count() or 1
+        if workers == 1 or sys._is_gil_enabled():
+            if len(text) > RegexTokenizer._STREAM_TEXT_LENGTH:
+                # a large text is encoded chunk by chunk as the split
+                # pattern finds them: no list of all the chunks next to the
+                # list of all the ids (a match object per chunk costs some
+                # speed, so short texts still split in one go)
+                return self._encode_chunks(self._iter_text(text))
+            return self._encode_chunks(self._split_text(text))
         # split text into chunks of text by categories defined in regex pattern
-        text_chunks: list[str] = regex.findall(self.compiled_pattern, text)
+        text_chunks: list[str] = self._split_text(text)
+        # chunks encode independently, so without a GIL a long text is cut
+        # into one slice per thread: the merges and the vocab index are only
+        # read, and the one shared mutable structure, the chunk encode
+        # cache, is guarded by its lock (taken only for chunks that are not
+        # a single token, and never while merging)
+        if len(text_chunks) > RegexTokenizer._PARALLEL_CHUNK_THRESHOLD:
+            slice_size: int = -(-len(text_chunks) // workers)  # ceil
+            slices: list[list[str]] = [
+                text_chunks[start : start + slice_size]
+                for start in range(0, len(text_chunks), slice_size)
+            ]
+            ids: list[int] = []
+            # map keeps the slices in order
+            for slice_ids in _get_chunk_executor().map(
+                self._encode_chunks, slices
+            ):
+                ids.extend(slice_ids)
+            return ids
+        return self._encode_chunks(text_chunks)
+
+    # Private method to encode text chunks one after the other
+    def _encode_chunks(self, text_chunks: Iterable[str]) -> list[int]:
         # all chunks of text are encoded separately, then results are joined
         ids: list[int] = []
-        for chunk in text_chunks:
-            chunk_bytes: bytes = chunk.encode(
-                "utf-8", errors="strict"
-            )  # raw bytes
+        # each chunk as its raw UTF-8 bytes: str.encode's defaults (utf-8,
+        # strict) spare the keyword parsing of an explicit call per chunk,
+        # and map() makes the calls from C
+        for chunk_bytes in map(str.encode, text_chunks):
             chunk_ids: list[int] = self._encode_chunk(chunk_bytes)
             ids.extend(chunk_ids)
         return ids
 
+    def encode_batch(
+        self, texts: list[str], workers: int | None = None
+    ) -> list[list[int]]:
+        """Encode every text like encode_ordinary, spreading the texts over
+        workers.
+
+        Free-threaded builds share this tokenizer across threads, one per
+        available CPU unless workers says otherwise. GIL builds encode
+        serially, unless workers > 1 is passed explicitly: then a batch of
+        at least _PROCESS_BATCH_LENGTH characters is spread over that many
+        worker processes, each receiving a copy of this tokenizer. The
+        processes are spawned, so a script calling this must guard its
+        entry point with `if __name__ == "__main__":`. Batches too small
+        to repay starting the workers are always encoded serially.
+        """
+        gil_enabled: bool = sys._is_gil_enabled()
+        if workers is None:
+            # worker processes are opt-in: default to threads or serial
+            workers = 1 if gil_enabled else os.process_cpu_count() or 1
+        workers = min(workers, len(texts))
+        batch_length: int = sum(map(len, texts))
+        min_length: int = (
+            RegexTokenizer._PROCESS_BATCH_LENGTH
+            if gil_enabled
+            else RegexTokenizer._THREAD_BATCH_LENGTH
+        )
+        if workers <= 1 or batch_length < min_length:
+            return [self.encode_ordinary(text) for text in texts]
+        # several texts per task keep the dispatch overhead down
+        chunksize: int = max(1, len(texts) // (workers * 4))
+        executor: Executor
+        if not gil_enabled:
+            executor = ThreadPoolExecutor(max_workers=workers)
+            with executor:
+                return list(
+                    executor.map(
+                        self.encode_ordinary, texts, chunksize=chunksize
+                    )
+                )
+        # spawn rather than fork: forking a process that runs other threads
+        # can deadlock the child
+        executor = ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_encode_worker,
+            initargs=(self,),
+        )
+        with executor:
+            return list(
+                executor.map(_encode_in_worker, texts, chunksize=chunksize)
+            )
+
     def encode(
         self,
         text: str,
@@ -251,10 +498,13 @@ class RegexTokenizer(BaseTokenizer, metaclass=ConstProtector):
             special = {}
         elif allowed_special == "none_raise":
             special = {}
-            for token in self.special_tokens:
-                if token in text:
+            # one scan of the text for all special tokens at once, with the
+            # pattern compiled at registration, instead of one per token
+            if self._special_pattern is not None:
+                found: regex.Match | None = self._special_pattern.search(text)
+                if found is not None:
                     raise ValueError(
-                        f"special token {token} found in text, but allowed_special='none_raise'"
+                        f"special token {found.group()} found in text, but allowed_special='none_raise'"
                     )
         elif isinstance(allowed_special, set):
             # Iterate over each key (k) and value (v) in all available special tokens
@@ -276,31 +526,26 @@ class RegexTokenizer(BaseTokenizer, metaclass=ConstProtector):
             # shortcut: if no special tokens, just use the ordinary encoding
             return self.encode_ordinary(text)
         # otherwise, we have to be careful with potential special tokens in text
-        # we handle special tokens by splitting the text
-        # based on the occurrence of any exact match with any of the special tokens
-        # we can use re.split for this. note that surrounding the pattern with ()
-        # makes it into a capturing group, so the special tokens will be included
-        # Create an empty list to hold the escaped special tokens
-        escaped_tokens: list[str] = []
-        for key_special in special:
-            # This ensures characters like '|' are treated as literal text, not regex commands.
-            escaped_k: str = regex.escape(key_special)
-            escaped_tokens.append(escaped_k)
-        # Join all the escaped tokens together with the "|" (OR) operator
-        # This builds the core of the pattern: "<\|user\|>|<\|bot\|>|..."
-        inner_pattern: str = "|".join(escaped_tokens)
-        special_pattern: str = "(" + inner_pattern + ")"
-        special_chunks: list[str] = regex.split(special_pattern, text)
-        # now all the special characters are separated from the rest of the text
-        # all chunks of text are encoded separately, then results are joined
+        # all special tokens allowed: reuse the pattern compiled at registration
+        special_pattern: regex.Pattern | None = self._special_pattern
+        if special is not self.special_tokens or special_pattern is None:
+            # a subset: compile its pattern once, then reuse it
+            special_key: frozenset[str] = frozenset(special)
+            special_pattern = self._special_pattern_cache.get(special_key)
+            if special_pattern is None:
+                special_pattern = self._compile_special_pattern(special)
+                self._special_pattern_cache[special_key] = special_pattern
+        # walk the special tokens found in a single scan of the text: the
+        # text between them is encoded normally, each special token is
+        # encoded separately as a special case (a text without any goes
+        # straight to encode_ordinary, with no split list built)
         ids: list[int] = []
-        for part in special_chunks:
-            if part in special:
-                # this is a special token, encode it separately as a special case
-                ids.append(special[part])
-            else:
-                # this is an ordinary sequence, encode it normally
-                ids.extend(self.encode_ordinary(part))
+        start: int = 0
+        for match in special_pattern.finditer(text):
+            ids.extend(self.encode_ordinary(text[start : match.start()]))
+            ids.append(special[match.group()])
+            start = match.end()
+        ids.extend(self.encode_ordinary(text[start:]))
         return ids
 
     def _save_model_file(self, save_dir: str, file_prefix: str) -> None:
@@ -336,7 +581,6 @@ class RegexTokenizer(BaseTokenizer, metaclass=ConstProtector):
         # read the model file
         merges: dict[tuple[int, int], int] = {}
         special_tokens: dict[str, int] = {}
-        idx: int = 256
         with open(model_full_path, encoding="utf-8") as f:
             # read the version
             version = f.readline().strip()
@@ -347,7 +591,7 @@ class RegexTokenizer(BaseTokenizer, metaclass=ConstProtector):
             # read the regex pattern
             self.pattern = f.readline().strip()
             try:
-                self.compiled_pattern = regex.compile(self.pattern)
+                self.compiled_pattern = _compile_pattern(self.pattern)
             except regex.error as e:
                 raise ValueError(
                     f"Invalid regex pattern in model file: {e}"
@@ -359,15 +603,25 @@ class RegexTokenizer(BaseTokenizer, metaclass=ConstProtector):
                 special, special_idx = f.readline().strip().split()
                 special_tokens[special] = int(special_idx)
             # read the merges
-            for line in f:
-                # Each line should contain two token IDs separated by a space
-                left_token_str, right_token_str = line.strip().split()
-                # Convert both IDs to integers
-                left_token = int(left_token_str)
-                right_token = int(right_token_str)
-                # Register this merge pair with a new token ID
-                merges[(left_token, right_token)] = idx
-                idx += 1
+            merges = self._read_merges(f)
         self.token_merges = merges
-        self.special_tokens = special_tokens
+        self.register_special_tokens(special_tokens)
         self.vocab = self._build_vocab()
+        self._reset_caches()
+
+
+# the tokenizer each encode_batch worker process encodes with
+_worker_tokenizer: RegexTokenizer | None = None
+
+
+# Private function to receive the tokenizer once per worker process
+def _init_encode_worker(tokenizer: RegexTokenizer) -> None:
+    global _worker_tokenizer
+    _worker_tokenizer = tokenizer
+
+
+# Private function to encode one text in a worker process
+def _encode_in_worker(text: str) -> list[int]:
+    if _worker_tokenizer is None:
+        raise ValueError("encode worker was not initialized")
+    return _worker_tokenizer.encode_ordinary(text)
@@ -1,12 +1,15 @@
 # -----------------------------------------------------------------------------
 # common test data
 
+import copy
 import os
-from typing import LiteralString
+from collections.abc import Iterator
+from pathlib import Path
 
 import pytest
 import tiktoken
 
+from minbpe import regex_tokenizer as regex_tokenizer_module
 from minbpe.basic_tokenizer import BasicTokenizer
 from minbpe.gpt4_tokenizer import GPT4Tokenizer
 from minbpe.regex_tokenizer import RegexTokenizer
@@ -35,14 +38,21 @@ def unpack(text: str) -> str:
         dirname: str = os.path.dirname(os.path.abspath(__file__))
         input_dir = os.path.join(dirname, "..", "input")
         file_name: str = os.path.join(input_dir, text[5:])
-        contents: str = open(file_name, encoding="utf-8").read()
+        contents: str = Path(file_name).read_text(encoding="utf-8")
         return contents
     else:
         return text
 
 
+# (name, unpacked text) of every test string, unpacked once at import so
+# that the tests receive the text itself; the name stays short for the ids
+unpacked_strings: list[tuple[str, str]] = [
+    (text, unpack(text)) for text in test_strings
+]
+
+
 # special tokens test string
-specials_string: LiteralString = (
+specials_string: str = (
     """
     <|endoftext|>HThis is first document, sometisdsfdsdsfsdsfdsfsdfdsf
     <|endoftext|>And this is another document, some more text here.
@@ -61,7 +71,7 @@ special_tokens: dict[str, int] = {
 }
 
 # complex text with special tokens
-llama_text: LiteralString = (
+llama_text: str = (
     """
     <|endoftext|>The llama (/ˈlɑːmə/; Spanish pronunciation: [ˈʎama] or [ˈʝama]) (Lama glama) is a domesticated South American camelid, widely used as a meat and pack animal by Andean cultures since the pre-Columbian era.
     Llamas are social animals and live with others as a herd. Their wool is soft and contains only a small amount of lanolin.[2] Llamas can learn simple tasks after a few repetitions. When using a pack, they can carry about 25 to 30% of their body weight for 8 to 13 km (5–8 miles).[3] The name llama (in the past also spelled "lama" or "glama") was adopted by European settlers from native Peruvians.[4]
@@ -75,51 +85,129 @@ llama_text: LiteralString = (
 
 # test encode/decode identity for a few different strings
 
-# Pre-instantiated tokenizer objects
-tokenizers: list[BasicTokenizer | GPT4Tokenizer | RegexTokenizer] = [
-    BasicTokenizer(),
-    RegexTokenizer(),
-    GPT4Tokenizer(),
-]
+
+# every tokenizer of the session caches its GPT-4 merges in a private
+# directory, never in the developer's ~/.cache/minbpe
+@pytest.fixture(scope="session", autouse=True)
+def cache_home(tmp_path_factory: pytest.TempPathFactory) -> Iterator[Path]:
+    cache_dir: Path = tmp_path_factory.mktemp("cache")
+    with pytest.MonkeyPatch.context() as patch:
+        patch.setenv("XDG_CACHE_HOME", str(cache_dir))
+        yield cache_dir
+
+
+# Pre-instantiated tokenizer objects, built once per session
+@pytest.fixture(scope="session")
+def basic_tokenizer() -> BasicTokenizer:
+    return BasicTokenizer()
+
+
+@pytest.fixture(scope="session")
+def regex_tokenizer() -> RegexTokenizer:
+    return RegexTokenizer()
+
+
+@pytest.fixture(scope="session")
+def gpt4_tokenizer() -> GPT4Tokenizer:
+    return GPT4Tokenizer()
+
+
+# the official GPT-4 tokenizer, loaded once per session
+@pytest.fixture(scope="session")
+def cl100k() -> tiktoken.Encoding:
+    return tiktoken.get_encoding("cl100k_base")
+
+
+@pytest.fixture(
+    scope="session",
+    params=["basic_tokenizer", "regex_tokenizer", "gpt4_tokenizer"],
+    ids=["basic", "regex", "gpt4"],
+)
+def tokenizer(
+    request: pytest.FixtureRequest,
+) -> BasicTokenizer | GPT4Tokenizer | RegexTokenizer:
+    # each param names one of the session fixtures above
+    shared_tokenizer: BasicTokenizer | GPT4Tokenizer | RegexTokenizer = (
+        request.getfixturevalue(request.param)
+    )
+    return shared_tokenizer
 
 
 @pytest.mark.parametrize(
-    "tokenizer", tokenizers, ids=["basic", "regex", "gpt4"]
+    ("name", "text_unpacked"),
+    unpacked_strings,
+    ids=[name[:20] for name, _ in unpacked_strings],
 )
-@pytest.mark.parametrize("text", test_strings)
 def test_encode_decode_identity(
-    tokenizer: BasicTokenizer | GPT4Tokenizer | RegexTokenizer, text: str
+    tokenizer: BasicTokenizer | GPT4Tokenizer | RegexTokenizer,
+    name: str,
+    text_unpacked: str,
 ) -> None:
-    text_unpacked: str = unpack(text)
     ids: list[int] = tokenizer.encode(text_unpacked)
     decoded: str = tokenizer.decode(ids)
     if text_unpacked != decoded:
         raise AssertionError(
-            f"Tokenizer failed identity check.\n"
+            f"Tokenizer failed identity check on {name!r}.\n"
             f"Original: {text_unpacked}\n"
             f"Decoded:  {decoded}"
         )
 
 
+# test that the optional PCRE2 backend splits text like the regex module
+@pytest.mark.parametrize(
+    "split_tokenizer",
+    ["regex_tokenizer", "gpt4_tokenizer"],
+    ids=["regex", "gpt4"],
+)
+def test_pcre2_split_equality(
+    split_tokenizer: str,
+    request: pytest.FixtureRequest,
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    pytest.importorskip("pcre2")
+    tokenizer: RegexTokenizer = request.getfixturevalue(split_tokenizer)
+    if (
+        regex_tokenizer_module._compile_pcre2_pattern(tokenizer.pattern)
+        is None
+    ):
+        raise AssertionError("PCRE2 failed to compile the split pattern.")
+    for name, text in unpacked_strings:
+        expected: list[str] = tokenizer.compiled_pattern.findall(text)
+        # as if the process had started with MINBPE_BACKEND=pcre2
+        with monkeypatch.context() as patch:
+            patch.setattr(regex_tokenizer_module, "_USE_PCRE2", True)
+            split_chunks: list[str] = tokenizer._split_text(text)
+            iter_chunks: list[str] = list(tokenizer._iter_text(text))
+        if split_chunks != expected or iter_chunks != expected:
+            raise AssertionError(
+                f"PCRE2 backend split {name!r} differently from regex."
+            )
+
+
 # test that our tokenizer matches the official GPT-4 tokenizer
-@pytest.mark.parametrize("text", test_strings)
-def test_gpt4_tiktoken_equality(text: str) -> None:
-    text_unpacked: str = unpack(text)
-    tokenizer: GPT4Tokenizer = GPT4Tokenizer()
-    enc: tiktoken.Encoding = tiktoken.get_encoding("cl100k_base")
-    tiktoken_ids: list[int] = enc.encode(text_unpacked)
-    gpt4_tokenizer_ids: list[int] = tokenizer.encode(text_unpacked)
-    if gpt4_tokenizer_ids != tiktoken_ids:
-        raise AssertionError(
-            f"GPT4 Tokinezer did not return the same as TikToken.\n"
-            f"Original: {text}\n"
-        )
+def test_gpt4_tiktoken_equality(
+    gpt4_tokenizer: GPT4Tokenizer, cl100k: tiktoken.Encoding
+) -> None:
+    # all test strings at once, through both batch encoders
+    texts: list[str] = [text for _, text in unpacked_strings]
+    tiktoken_batch: list[list[int]] = cl100k.encode_batch(texts)
+    gpt4_tokenizer_batch: list[list[int]] = gpt4_tokenizer.encode_batch(texts)
+    for i, (gpt4_tokenizer_ids, tiktoken_ids) in enumerate(
+        zip(gpt4_tokenizer_batch, tiktoken_batch, strict=True)
+    ):
+        if gpt4_tokenizer_ids != tiktoken_ids:
+            raise AssertionError(
+                f"GPT4 Tokinezer did not return the same as TikToken.\n"
+                f"Original (test_strings[{i}]): {test_strings[i]}\n"
+            )
 
 
 # test the handling of special tokens
-def test_gpt4_tiktoken_equality_special_tokens() -> None:
-    tokenizer: GPT4Tokenizer = GPT4Tokenizer()
-    enc: tiktoken.Encoding = tiktoken.get_encoding("cl100k_base")
+def test_gpt4_tiktoken_equality_special_tokens(
+    gpt4_tokenizer: GPT4Tokenizer, cl100k: tiktoken.Encoding
+) -> None:
+    tokenizer: GPT4Tokenizer = gpt4_tokenizer
+    enc: tiktoken.Encoding = cl100k
     tiktoken_ids: list[int] = enc.encode(
         specials_string, allowed_special="all"
     )
@@ -133,16 +221,102 @@ def test_gpt4_tiktoken_equality_special_tokens() -> None:
         )
 
 
-tokenizers_test: list[BasicTokenizer | RegexTokenizer] = [
-    BasicTokenizer(),
-    RegexTokenizer(),
-]
+# test that special token ids decode back to their text
+def test_gpt4_special_tokens_identity(gpt4_tokenizer: GPT4Tokenizer) -> None:
+    ids: list[int] = gpt4_tokenizer.encode(
+        specials_string, allowed_special="all"
+    )
+    decoded: str = gpt4_tokenizer.decode(ids)
+    if decoded != specials_string:
+        raise AssertionError(
+            f"GPT4 Tokenizer failed identity check on special tokens.\n"
+            f"Original: {specials_string}\n"
+            f"Decoded:  {decoded}"
+        )
 
 
-# basic train test
-@pytest.mark.parametrize(
-    "tokenizers_train", tokenizers_test, ids=["basic", "regex"]
+# test that a saved GPT-4 tokenizer loads back with the same behaviour
+def test_gpt4_save_load(gpt4_tokenizer: GPT4Tokenizer, tmp_path: Path) -> None:
+    text: str = specials_string
+    ids: list[int] = gpt4_tokenizer.encode(text, allowed_special="all")
+    gpt4_tokenizer.save(str(tmp_path), "gpt4_tmp")
+    # load into a private copy, the session tokenizer stays untouched
+    new_tokenizer: GPT4Tokenizer = copy.deepcopy(gpt4_tokenizer)
+    new_tokenizer.load(str(tmp_path), "gpt4_tmp.model")
+    new_ids: list[int] = new_tokenizer.encode(text, allowed_special="all")
+    if new_ids != ids:
+        raise AssertionError(
+            f"Loaded GPT4 Tokenizer encoding did not match previous encode.\n"
+            f"Original: {text}\n"
+            f"Old IDs:  {ids}\n"
+            f"New IDs:  {new_ids}"
+        )
+    new_decoded: str = new_tokenizer.decode(new_ids)
+    if new_decoded != text:
+        raise AssertionError(
+            f"Loaded GPT4 Tokenizer failed identity check.\n"
+            f"Original: {text}\n"
+            f"Decoded:  {new_decoded}"
+        )
+
+
+# test that the GPT-4 merges cache is built, reused and rebuilt when corrupt
+def test_gpt4_cache(
+    gpt4_tokenizer: GPT4Tokenizer,
+    tmp_path: Path,
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path))
+    monkeypatch.delenv("MINBPE_NO_CACHE", raising=False)
+    text: str = specials_string
+    ids: list[int] = gpt4_tokenizer.encode(text, allowed_special="all")
+    cache_dir: Path = tmp_path / "minbpe"
+    # cold: the merges are recovered and written to the cache
+    cold_ids: list[int] = GPT4Tokenizer().encode(text, allowed_special="all")
+    cache_files: list[Path] = list(cache_dir.iterdir())
+    if len(cache_files) != 1 or cold_ids != ids:
+        raise AssertionError(
+            f"Cold GPT4 Tokenizer did not write one cache file.\n"
+            f"Cache files: {cache_files}"
+        )
+    cache_file: Path = cache_files[0]
+    cold_stat: os.stat_result = cache_file.stat()
+    # warm: the cache is read back and, being valid, left as it is
+    warm_ids: list[int] = GPT4Tokenizer().encode(text, allowed_special="all")
+    warm_stat: os.stat_result = cache_file.stat()
+    if warm_ids != ids or (warm_stat.st_ino, warm_stat.st_mtime_ns) != (
+        cold_stat.st_ino,
+        cold_stat.st_mtime_ns,
+    ):
+        raise AssertionError("Warm GPT4 Tokenizer did not reuse the cache.")
+    # corrupt: an unreadable cache is rebuilt and replaced
+    cache_file.write_bytes(b"\x80\x06 not a model file")
+    rebuilt_ids: list[int] = GPT4Tokenizer().encode(
+        text, allowed_special="all"
+    )
+    if rebuilt_ids != ids:
+        raise AssertionError(
+            f"GPT4 Tokenizer with a corrupt cache did not match.\n"
+            f"Original: {text}\n"
+            f"Old IDs:  {ids}\n"
+            f"New IDs:  {rebuilt_ids}"
+        )
+    if not cache_file.read_bytes().startswith(b"minbpe v1\n"):
+        raise AssertionError("Corrupt GPT4 cache file was not rewritten.")
+
+
+# a fresh, untrained tokenizer for every test that trains one
+@pytest.fixture(
+    params=[BasicTokenizer, RegexTokenizer], ids=["basic", "regex"]
 )
+def tokenizers_train(
+    request: pytest.FixtureRequest,
+) -> BasicTokenizer | RegexTokenizer:
+    new_tokenizer: BasicTokenizer | RegexTokenizer = request.param()
+    return new_tokenizer
+
+
+# basic train test
 def test_wikipedia_example(
     tokenizers_train: BasicTokenizer | RegexTokenizer,
 ) -> None:
@@ -176,64 +350,105 @@ def test_wikipedia_example(
             f"Original: {text}\n"
             f"Encoded:  {ids}"
         )
-    if tokenizer.decode(tokenizer.encode(text)) != text:
+    decoded: str = tokenizer.decode(ids)
+    if decoded != text:
         raise AssertionError(
             f"Tokenizer failed identity check after training.\n"
             f"Original: {text}\n"
-            f"Decoded:  {tokenizer.decode(tokenizer.encode(text))}"
+            f"Decoded:  {decoded}"
         )
 
 
+# a Tokenizer trained once per session on llama_text
+@pytest.fixture(scope="session")
+def trained_regex() -> RegexTokenizer:
+    # take a bit more complex piece of text and train the tokenizer, chosen at random
+    # create a Tokenizer and do 64 merges
+    tokenizer: RegexTokenizer = RegexTokenizer()
+    tokenizer.train(llama_text, 256 + 64)
+    return tokenizer
+
+
 @pytest.mark.parametrize(
     "special_tokens", [{}, special_tokens], ids=["none", "with_specials"]
 )
-def test_save_load(special_tokens: dict[str, int]) -> None:
-    # take a bit more complex piece of text and train the tokenizer, chosen at random
+def test_save_load(
+    special_tokens: dict[str, int],
+    tmp_path: Path,
+    trained_regex: RegexTokenizer,
+) -> None:
     text: str = llama_text
-    # create a Tokenizer and do 64 merges
-    tokenizer: RegexTokenizer = RegexTokenizer()
-    tokenizer.train(text, 256 + 64)
+    # every case registers its own special tokens on a private copy
+    tokenizer: RegexTokenizer = copy.deepcopy(trained_regex)
     tokenizer.register_special_tokens(special_tokens)
+    # encode once: the same ids are checked before and after save/load
+    ids: list[int] = tokenizer.encode(text, "all")
     # verify that decode(encode(x)) == x
-    if tokenizer.decode(tokenizer.encode(text, "all")) != text:
+    decoded: str = tokenizer.decode(ids)
+    if decoded != text:
         raise AssertionError(
             f"Tokenizer failed decoding text to the original that was used to train.\n"
             f"Original: {text}\n"
-            f"Decoded:  {tokenizer.decode(tokenizer.encode(text, 'all'))}"
+            f"Decoded:  {decoded}"
         )
     # verify that save/load work as expected
-    ids: list[int] = tokenizer.encode(text, "all")
-    # save the tokenizer
-    tokenizer.save("src/output/", "test_tokenizer_tmp")
+    # save the tokenizer (in a directory of its own for every case)
+    tokenizer.save(str(tmp_path), "test_tokenizer_tmp")
     # re-load the tokenizer
     new_tokenizer: RegexTokenizer = RegexTokenizer()
-    new_tokenizer.load("src/output/", "test_tokenizer_tmp.model")
+    new_tokenizer.load(str(tmp_path), "test_tokenizer_tmp.model")
     # verify that decode(encode(x)) == x
-    if new_tokenizer.decode(ids) != text:
+    loaded_decoded: str = new_tokenizer.decode(ids)
+    if loaded_decoded != text:
         raise AssertionError(
             f"New Loaded Tokenizer failed decoding text to the original that was used to train.\n"
             f"Original: {text}\n"
-            f"Decoded:  {new_tokenizer.decode(ids)}"
+            f"Decoded:  {loaded_decoded}"
         )
-    if new_tokenizer.decode(new_tokenizer.encode(text, "all")) != text:
+    new_ids: list[int] = new_tokenizer.encode(text, "all")
+    new_decoded: str = new_tokenizer.decode(new_ids)
+    if new_decoded != text:
         raise AssertionError(
             f"New Loaded Tokenizer failed identity check after loading, encode/decode conflict.\n"
             f"Original: {text}\n"
-            f"Decoded:  {new_tokenizer.decode(new_tokenizer.encode(text, 'all'))}"
+            f"Decoded:  {new_decoded}"
         )
-    if new_tokenizer.encode(text, "all") != ids:
+    if new_ids != ids:
         raise AssertionError(
             f" New Loaded Tokenizer failed encoding did not match previous encode.\n"
             f"Original: {text}\n"
             f"Old IDs:  {ids}\n"
-            f"New IDs:  {tokenizer.encode(text, 'all')}"
+            f"New IDs:  {new_ids}"
+        )
+
+
+# test that encode_batch matches encoding the texts one by one
+@pytest.mark.parametrize("workers", [1, 2], ids=["serial", "parallel"])
+def test_encode_batch(workers: int, trained_regex: RegexTokenizer) -> None:
+    # repeated so the batch is long enough to be spread over the workers
+    copies: int = 23
+    texts: list[str] = [text for _, text in unpacked_strings] * copies
+    if sum(map(len, texts)) < RegexTokenizer._PROCESS_BATCH_LENGTH:
+        raise AssertionError("Test batch too short to reach the workers.")
+    batch_ids: list[list[int]] = trained_regex.encode_batch(
+        texts, workers=workers
+    )
+    # every copy of a text encodes alike: encode each one once
+    expected_ids: list[list[int]] = [
+        trained_regex.encode(text) for _, text in unpacked_strings
+    ] * copies
+    if batch_ids != expected_ids:
+        raise AssertionError(
+            f"encode_batch with {workers} workers did not match encode."
+        )
+
+
+def test_encode_batch_empty(trained_regex: RegexTokenizer) -> None:
+    batch_ids: list[list[int]] = trained_regex.encode_batch([])
+    if batch_ids != []:
+        raise AssertionError(
+            f"encode_batch of no texts returned {batch_ids}, expected []."
         )
-    # delete the temporary files
-    for file in [
-        "src/output/test_tokenizer_tmp.model",
-        "src/output/test_tokenizer_tmp.vocab",
-    ]:
-        os.remove(file)
 
 
 if __name__ == "__main__":
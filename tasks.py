@@ -9,6 +9,7 @@ Usage:
     invoke lint            - Lint code with Ruff
     invoke lint-fix        - Lint and auto-fix with Ruff
     invoke typecheck       - Type check with MyPy
+    invoke test            - Run the test suite (--no-parallel for serial)
     invoke qa              - Run all quality checks
     invoke clean           - Clean cache directories
     invoke install         - Install development dependencies
@@ -16,25 +17,50 @@ Usage:
     invoke --list          - Show all available tasks
 """
 
+import os
+import shlex
 import shutil
 import sys
+from concurrent.futures import Future, ThreadPoolExecutor
 from pathlib import Path
+from typing import Any
 
 from invoke.context import Context
+from invoke.exceptions import Exit
+from invoke.runners import Result
 from invoke.tasks import task
 
+# argv (after the interpreter) of the read-only checks, shared by their
+# tasks and check_all
+FORMAT_CHECK_ARGS: tuple[str, ...] = ('-m', 'black', '.', '--check', '--diff')
+# pyproject.toml turns ruff's fixes on by default: lint must not edit files
+LINT_ARGS: tuple[str, ...] = ('-m', 'ruff', 'check', '.', '--no-fix')
+TYPECHECK_ARGS: tuple[str, ...] = ('-m', 'mypy', '.')
+
+
+def _run(c: Context, *args: str, **kwargs: Any) -> Result | None:
+    """Run `sys.executable -m <tool>`-style commands through c.run.
+
+    c.run still starts every command through a shell: shlex.join only
+    quotes each argument, so that the shell passes it through unchanged.
+    Running the tools with the current interpreter pins them to the
+    environment invoke runs in, and invoke's echo/dry/warn settings apply.
+    Keyword arguments go to c.run unchanged.
+    """
+    return c.run(shlex.join([sys.executable, *args]), **kwargs)
+
 
 @task
 def help(c: Context) -> None:
     """Show available tasks."""
-    c.run("invoke --list")
+    _run(c, '-m', 'invoke', '--list')
 
 
 @task
 def format(c: Context) -> None:
     """Format code with Black."""
     print("🎨 Formatting code with Black...")
-    c.run("black .")
+    _run(c, '-m', 'black', '.')
     print("✅ Formatting complete!")
 
 
@@ -42,21 +68,21 @@ def format(c: Context) -> None:
 def format_check(c: Context) -> None:
     """Check code formatting without modifying files."""
     print("🔍 Checking code formatting...")
-    c.run("black . --check --diff")
+    _run(c, *FORMAT_CHECK_ARGS)
 
 
 @task
 def lint(c: Context) -> None:
     """Lint code with Ruff (no fixes)."""
     print("🔍 Linting code with Ruff...")
-    c.run("ruff check .")
+    _run(c, *LINT_ARGS)
 
 
 @task
 def lint_fix(c: Context) -> None:
     """Lint code with Ruff and auto-fix issues."""
     print("🔧 Linting and fixing code with Ruff...")
-    c.run("ruff check . --fix")
+    _run(c, '-m', 'ruff', 'check', '.', '--fix')
     print("✅ Linting complete!")
 
 
@@ -64,11 +90,25 @@ def lint_fix(c: Context) -> None:
 def typecheck(c: Context) -> None:
     """Type check code with MyPy."""
     print("🔬 Type checking with MyPy...")
-    c.run("mypy .")
+    _run(c, *TYPECHECK_ARGS)
     print("✅ Type checking complete!")
 
 
-@task(pre=[format, lint_fix, typecheck])
+@task
+def test(c: Context, parallel: bool = True) -> None:
+    """Run the test suite, spread over all CPUs unless --no-parallel.
+
+    The tokenizers and trained models are session-scoped fixtures, so
+    each pytest-xdist worker builds them once and shares them across
+    its tests.
+    """
+    print("🧪 Running tests...")
+    xdist: tuple[str, ...] = ('-n', 'auto') if parallel else ()
+    _run(c, '-m', 'pytest', *xdist, '--tb=short', '-q', 'src/tests')
+    print("✅ Tests complete!")
+
+
+@task(pre=[format, lint_fix, typecheck, test])
 def qa(c: Context) -> None:
     """Run all quality assurance checks."""
     print("\n" + "=" * 50)
@@ -76,39 +116,57 @@ def qa(c: Context) -> None:
     print("=" * 50)
 
 
+# cache directories and files removed by `clean`
+CACHE_DIRS: tuple[str, ...] = (
+    '__pycache__',
+    '.mypy_cache',
+    '.ruff_cache',
+    '.pytest_cache',
+)
+CACHE_DIR_SUFFIXES: tuple[str, ...] = ('.egg-info',)
+CACHE_FILE_SUFFIXES: tuple[str, ...] = ('.pyc', '.pyo', '.pyd')
+# directories `clean` never descends into
+PRUNE_DIRS: frozenset[str] = frozenset({'.git', '.venv', 'venv'})
+
+
+def _sweep(root: str, dirs: list[str], files: list[str]) -> None:
+    """Collect cache directories and files under root in a single pass."""
+    with os.scandir(root) as entries:
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                if entry.name in CACHE_DIRS or entry.name.endswith(
+                    CACHE_DIR_SUFFIXES
+                ):
+                    dirs.append(entry.path)
+                elif entry.name not in PRUNE_DIRS:
+                    _sweep(entry.path, dirs, files)
+            elif entry.name.endswith(CACHE_FILE_SUFFIXES):
+                files.append(entry.path)
+
+
+def _remove(path: str) -> None:
+    """Remove a cache directory or file, ignoring ones already gone."""
+    if os.path.isdir(path):
+        shutil.rmtree(path, ignore_errors=True)
+    else:
+        Path(path).unlink(missing_ok=True)
+
+
 @task
 def clean(c: Context) -> None:
     """Remove cache directories and temporary files."""
     print("🧹 Cleaning cache directories...")
-
-    cache_dirs = [
-        '__pycache__',
-        '.mypy_cache',
-        '.ruff_cache',
-        '.pytest_cache',
-        '*.egg-info',
-    ]
-
-    cache_files = [
-        '*.pyc',
-        '*.pyo',
-        '*.pyd',
-    ]
-
-    # Remove directories
-    for pattern in cache_dirs:
-        for path in Path('.').rglob(pattern):
-            if path.is_dir():
-                print(f"  Removing {path}")
-                shutil.rmtree(path, ignore_errors=True)
-
-    # Remove files
-    for pattern in cache_files:
-        for path in Path('.').rglob(pattern):
-            if path.is_file():
-                print(f"  Removing {path}")
-                path.unlink(missing_ok=True)
-
+    # one walk over the tree, instead of one rglob per pattern
+    dirs: list[str] = []
+    files: list[str] = []
+    _sweep('.', dirs, files)
+    targets: list[str] = dirs + files
+    for path in targets:
+        print(f"  Removing {path}")
+    # removal is bound by unlink syscalls: overlap them on a thread pool
+    with ThreadPoolExecutor(max_workers=os.cpu_count()) as executor:
+        # consume the results so a failed removal is raised here
+        list(executor.map(_remove, targets))
     print("✅ Cleanup complete!")
 
 
@@ -116,7 +174,7 @@ def clean(c: Context) -> None:
 def install(c: Context) -> None:
     """Install development dependencies."""
     print("📦 Installing development dependencies...")
-    c.run(f"{sys.executable} -m pip install -r requirements.txt")
+    _run(c, '-m', 'pip', 'install', '-r', 'requirements.txt')
     print("✅ Installation complete!")
 
 
@@ -124,9 +182,29 @@ def install(c: Context) -> None:
 def check_all(c: Context) -> None:
     """Run format check, lint, and typecheck (for CI/CD)."""
     print("🔍 Running all checks without modifications...")
-    format_check(c)
-    lint(c)
-    typecheck(c)
+    checks: tuple[tuple[str, tuple[str, ...]], ...] = (
+        ("🔍 Checking code formatting...", FORMAT_CHECK_ARGS),
+        ("🔍 Linting code with Ruff...", LINT_ARGS),
+        ("🔬 Type checking with MyPy...", TYPECHECK_ARGS),
+    )
+    # none of the checks modifies the sources, so they run side by side and
+    # the wall-clock time is the slowest one (mypy) rather than the sum;
+    # each one's output is captured and printed as a block once it is done
+    with ThreadPoolExecutor(max_workers=len(checks)) as executor:
+        futures: list[Future[Result | None]] = [
+            executor.submit(_run, c, *args, hide=True, warn=True)
+            for _, args in checks
+        ]
+    failed: bool = False
+    for (title, _), future in zip(checks, futures, strict=True):
+        print(title)
+        result: Result | None = future.result()
+        if result is not None:
+            print(result.stdout, end="")
+            print(result.stderr, end="", file=sys.stderr)
+            failed = failed or result.failed
+    if failed:
+        raise Exit("\n❌ Some checks failed!", code=1)
     print("\n✅ All checks passed!")
 
 
@@ -143,5 +221,5 @@ def run_tests_init(c: Context) -> None:
         print(f"Error: {target} not found. Nothing to run.")
         return
     print(f"▶ Running {target} with {sys.executable}...")
-    c.run(f"{sys.executable} -u {target}")
+    _run(c, '-u', str(target))
     print("✅ Finished running tests init file")